@@ -0,0 +1,50 @@
+"""Per-message cost of SessionCrypto encrypt/decrypt with and without the cached shared key.
+
+Run: python devtools/bench_session_crypto.py [messages]
+"""
+import json
+import sys
+from timeit import timeit
+
+from nacl.encoding import HexEncoder
+from nacl.public import Box, PublicKey
+
+from pytonconnect.crypto import SessionCrypto
+
+MESSAGE = json.dumps({
+    'method': 'sendTransaction',
+    'params': [json.dumps({'valid_until': 1681223913, 'messages': [{'address': '0:' + '0' * 64, 'amount': '1'}]})],
+    'id': '1',
+})
+
+
+def encrypt_uncached(crypto: SessionCrypto, message: str, receiver_pub_key_hex: str):
+    # SessionCrypto.encrypt before the shared key cache
+    box = Box(crypto.key_pair, PublicKey(receiver_pub_key_hex, HexEncoder))
+    encrypted = box.encrypt(message.encode('utf-8'), crypto.create_nonce())
+    return encrypted.nonce + encrypted.ciphertext
+
+
+def decrypt_uncached(crypto: SessionCrypto, message: bytes, sender_pub_key_hex: str):
+    box = Box(crypto.key_pair, PublicKey(sender_pub_key_hex, HexEncoder))
+    return box.decrypt(message[Box.NONCE_SIZE:], message[:Box.NONCE_SIZE]).decode('utf-8')
+
+
+def main(number: int):
+    app, wallet = SessionCrypto(), SessionCrypto()
+    encrypted = app.encrypt(MESSAGE, wallet.session_id)
+    raw = encrypt_uncached(app, MESSAGE, wallet.session_id)
+
+    cases = (
+        ('encrypt uncached', lambda: encrypt_uncached(app, MESSAGE, wallet.session_id)),
+        ('encrypt cached', lambda: app.encrypt(MESSAGE, wallet.session_id)),
+        ('decrypt uncached', lambda: decrypt_uncached(wallet, raw, app.session_id)),
+        ('decrypt cached', lambda: wallet.decrypt(encrypted, app.session_id)),
+    )
+    for name, case in cases:
+        seconds = timeit(case, number=number)
+        print(f'{name:<18} {seconds / number * 1e6:8.1f} us/message')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -1,7 +1,17 @@
+from pytonconnect._bulk_restore import RestoreProgress, restore_connections
+from pytonconnect._connection_scheduler import ConnectionScheduler
+from pytonconnect._events import ConnectionEvent, EventStream
 from pytonconnect._ton_connect import TonConnect
+from pytonconnect._ton_connect_hub import TonConnectHub
 from pytonconnect._wallets_list_manager import WalletsListManager
 
 __all__ = [
     'TonConnect',
+    'TonConnectHub',
+    'ConnectionScheduler',
+    'ConnectionEvent',
+    'EventStream',
     'WalletsListManager',
+    'RestoreProgress',
+    'restore_connections',
 ]
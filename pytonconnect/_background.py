@@ -0,0 +1,26 @@
+import asyncio
+from functools import partial
+
+from pytonconnect.logger import _LOGGER
+
+# the event loop keeps only weak references to tasks, running background tasks are kept here
+_TASKS = set()
+
+
+def run_in_background(coro, description: str) -> asyncio.Task:
+    """Run the coroutine as a task kept until it is done, a failure is logged with the `description`."""
+    task = asyncio.get_running_loop().create_task(coro)
+    _TASKS.add(task)
+    task.add_done_callback(partial(_on_done, description))
+    return task
+
+
+def call_later_in_background(delay: float, fn, description: str) -> asyncio.TimerHandle:
+    """Run the coroutine function `fn` in background after `delay` seconds, e.g. a debounced flush."""
+    return asyncio.get_running_loop().call_later(delay, lambda: run_in_background(fn(), description))
+
+
+def _on_done(description: str, task: asyncio.Task):
+    _TASKS.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        _LOGGER.error(f'{description} failed', exc_info=task.exception())
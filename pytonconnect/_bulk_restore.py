@@ -0,0 +1,85 @@
+import asyncio
+from dataclasses import dataclass
+
+from pytonconnect.logger import _LOGGER
+
+from ._ton_connect import TonConnect
+
+
+@dataclass
+class RestoreProgress:
+    total: int
+    done: int = 0
+    restored: int = 0
+    failed: int = 0  # restores raised an exception
+
+    @property
+    def not_found(self) -> int:
+        """Connectors without a stored session."""
+        return self.done - self.restored - self.failed
+
+
+class _BridgeRamp:
+    """Spaces out connections to the same bridge by `1 / rate` seconds."""
+
+    _interval: float
+    _next_slot: dict
+
+    def __init__(self, rate: float):
+        self._interval = 1 / rate if rate else 0
+        self._next_slot = {}
+
+    async def wait(self, bridge_url: str):
+        if not self._interval:
+            return
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        slot = max(now, self._next_slot.get(bridge_url, now))
+        self._next_slot[bridge_url] = slot + self._interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+async def restore_connections(connectors: dict,
+                              concurrency: int = 100,
+                              ramp_rate: float = None,
+                              on_progress=None,
+                              auto_listen=True) -> dict:
+    """Restore stored sessions of many connectors.
+
+    Sessions are read from the storage first, then bridge connections are opened with at most
+    `concurrency` restores in flight and at most `ramp_rate` new connections per second to each bridge.
+    Pass the same HttpClientPool (and BridgeMultiplexer) to the connectors to reuse HTTP connections.
+
+    :param connectors: dict of key -> TonConnect
+    :param concurrency: maximum number of sessions restored at the same time
+    :param ramp_rate: maximum number of connections opened per second to one bridge, None is unlimited
+    :param on_progress: will be called with RestoreProgress after every restored session
+    :param auto_listen: open bridge connections, if False sessions are restored lazily without network
+    :return: dict of key -> True if connection is restored
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    ramp = _BridgeRamp(ramp_rate)
+    progress = RestoreProgress(total=len(connectors))
+
+    async def restore(connector: TonConnect):
+        async with semaphore:
+            try:
+                is_restored = await connector.restore_connection(auto_listen=False)
+                if is_restored and auto_listen:
+                    await ramp.wait(connector._provider._session.bridge_url)
+                    await connector.unpause_connection()
+            except Exception:
+                _LOGGER.exception('Bulk restore connection')
+                progress.failed += 1
+                is_restored = False
+
+        progress.done += 1
+        progress.restored += bool(is_restored)
+        if on_progress is not None:
+            on_progress(progress)
+        return is_restored
+
+    keys = list(connectors)
+    results = await asyncio.gather(*[restore(connectors[key]) for key in keys])
+    return dict(zip(keys, results))
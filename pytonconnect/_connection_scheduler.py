@@ -0,0 +1,104 @@
+import asyncio
+from collections import OrderedDict
+
+from pytonconnect.logger import _LOGGER
+
+
+class ConnectionScheduler:
+    """Pauses bridge connections of idle connectors and caps the number of open connections.
+
+    Connectors created with the scheduler report their activity (connect, restore, requests, wallet events).
+    A connector without activity for `idle_timeout` seconds is paused, when more than `max_open_connections`
+    connectors are active the least recently active one is paused. Connectors waiting for a wallet response
+    (to a request or a connect) are never paused. A paused connector is resumed from its last event id before the next request
+    or by `wake()`.
+    """
+
+    DEFAULT_IDLE_TIMEOUT = 300
+
+    _idle_timeout: float
+    _max_open_connections: int
+    _sweep_interval: float
+    _active: OrderedDict
+    _sweeper: asyncio.Task
+
+    def __init__(self,
+                 idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+                 max_open_connections: int = None,
+                 sweep_interval: float = None):
+        """
+        :param idle_timeout: time in seconds without activity after which the connection is paused
+        :param max_open_connections: maximum number of open connections, None is unlimited
+        :param sweep_interval: how often idle connections are looked for, a quarter of `idle_timeout` by default
+        """
+        self._idle_timeout = idle_timeout
+        self._max_open_connections = max_open_connections
+        self._sweep_interval = sweep_interval or max(1, idle_timeout / 4)
+        self._active = OrderedDict()  # connector -> last activity time, least recently active first
+        self._sweeper = None
+
+    @property
+    def active_count(self) -> int:
+        """Number of connectors with an open (not paused by the scheduler) connection."""
+        return len(self._active)
+
+    def touch(self, connector):
+        """Register activity of the connector."""
+        loop = asyncio.get_running_loop()
+        self._active[connector] = loop.time()
+        self._active.move_to_end(connector)
+
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = loop.create_task(self._sweep())
+
+        if self._max_open_connections is not None:
+            self._evict(keep=connector)
+
+    def forget(self, connector):
+        """Stop tracking the connector, e.g. when it is paused or closed by the app."""
+        self._active.pop(connector, None)
+
+    async def wake(self, connector):
+        """Resume the connection of the connector if it was paused."""
+        self.touch(connector)
+        if connector._provider is not None:
+            await connector._provider.ensure_listening()
+
+    def close(self):
+        """Stop pausing connections."""
+        if self._sweeper is not None and not self._sweeper.done():
+            self._sweeper.cancel()
+        self._sweeper = None
+        self._active = OrderedDict()
+
+    def _is_busy(self, connector) -> bool:
+        # waiting for a request response or for the wallet to answer a connect
+        provider = connector._provider
+        return provider is not None and (bool(provider._pending_requests) or provider.is_connecting)
+
+    def _pause(self, connector):
+        self._active.pop(connector, None)
+        if connector._provider is None:
+            return
+        try:
+            connector._provider.pause()
+        except Exception:
+            _LOGGER.exception('Scheduler pause connection')
+
+    def _evict(self, keep):
+        for connector in list(self._active):
+            if len(self._active) <= self._max_open_connections:
+                break
+            if connector is not keep and not self._is_busy(connector):
+                self._pause(connector)
+
+    async def _sweep(self):
+        loop = asyncio.get_running_loop()
+        while self._active:
+            await asyncio.sleep(self._sweep_interval)
+            deadline = loop.time() - self._idle_timeout
+            for connector, last_activity in list(self._active.items()):
+                if last_activity > deadline:
+                    break  # ordered by activity, the rest are newer
+                if not self._is_busy(connector):
+                    self._pause(connector)
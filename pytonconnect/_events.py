@@ -0,0 +1,161 @@
+import asyncio
+import inspect
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from pytonconnect.exceptions import EventsOverflowError, TonConnectError
+from pytonconnect.logger import _LOGGER
+from pytonconnect.parsers import WalletInfo
+
+
+@dataclass
+class ConnectionEvent:
+    type: str  # 'connect', 'connect_error' or 'disconnect'
+    wallet: Optional[WalletInfo] = None
+    error: Optional[TonConnectError] = None
+    user_id: Any = None  # set by TonConnectHub
+
+
+class EventStream:
+    """Async iterator over connection events with a bounded queue.
+
+    The queue never blocks the bridge connection, when it is full the `overflow` policy applies:
+    'drop_oldest' drops the oldest queued event, 'drop_newest' drops the received one,
+    'error' closes the stream and raises EventsOverflowError from the iteration.
+    """
+
+    OVERFLOW_DROP_OLDEST = 'drop_oldest'
+    OVERFLOW_DROP_NEWEST = 'drop_newest'
+    OVERFLOW_ERROR = 'error'
+
+    _maxsize: int
+    _overflow: str
+    _on_close: callable
+    _queue: deque
+    _waiter: asyncio.Future
+    _closed: bool
+    _error: Exception
+
+    dropped_count: int
+
+    def __init__(self, maxsize: int, overflow: str, on_close=None):
+        if overflow not in (self.OVERFLOW_DROP_OLDEST, self.OVERFLOW_DROP_NEWEST, self.OVERFLOW_ERROR):
+            raise ValueError(f'Unknown overflow policy {overflow}')
+
+        self._maxsize = maxsize
+        self._overflow = overflow
+        self._on_close = on_close
+        self._queue = deque()
+        self._waiter = None
+        self._closed = False
+        self._error = None
+        self.dropped_count = 0
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def put(self, event: ConnectionEvent):
+        if self._closed:
+            return
+
+        if self._maxsize and len(self._queue) >= self._maxsize:
+            self.dropped_count += 1
+            if self._overflow == self.OVERFLOW_DROP_NEWEST:
+                return
+            if self._overflow == self.OVERFLOW_ERROR:
+                self._error = EventsOverflowError(f'{len(self._queue)} events are not read')
+                self.close()
+                return
+            self._queue.popleft()
+
+        self._queue.append(event)
+        self._wake()
+
+    def close(self):
+        """Stop receiving events, the queued events can still be read."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._on_close is not None:
+            self._on_close(self)
+        self._wake()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> ConnectionEvent:
+        while True:
+            if self._error is not None:
+                error, self._error = self._error, None
+                self._queue.clear()
+                raise error
+            if self._queue:
+                return self._queue.popleft()
+            if self._closed:
+                raise StopAsyncIteration
+
+            self._waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.close()
+
+    def _wake(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+
+class EventDispatcher:
+    """Delivers connection events to event streams and calls sync or async listeners.
+
+    Async listeners are scheduled as tasks, so they never block the processing of bridge messages.
+    """
+
+    DEFAULT_MAXSIZE = 100
+
+    _streams: list
+    _tasks: set
+
+    def __init__(self):
+        self._streams = []
+        self._tasks = set()
+
+    @property
+    def streams_count(self) -> int:
+        """Number of open event streams."""
+        return len(self._streams)
+
+    def subscribe(self, maxsize: int = DEFAULT_MAXSIZE,
+                  overflow: str = EventStream.OVERFLOW_DROP_OLDEST) -> EventStream:
+        stream = EventStream(maxsize, overflow, on_close=self._streams.remove)
+        self._streams.append(stream)
+        return stream
+
+    def emit(self, event: ConnectionEvent):
+        for stream in self._streams.copy():
+            stream.put(event)
+
+    def call(self, listener, *args):
+        result = listener(*args)
+        if inspect.isawaitable(result):
+            task = asyncio.ensure_future(result)
+            # keep a reference until the task is done, the loop holds only weak references to tasks
+            self._tasks.add(task)
+            task.add_done_callback(self._on_task_done)
+
+    def close(self):
+        for stream in self._streams.copy():
+            stream.close()
+
+    def _on_task_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            _LOGGER.error('Status change listener failed', exc_info=task.exception())
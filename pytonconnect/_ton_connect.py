@@ -1,33 +1,50 @@
 import asyncio
+import time
 import typing
 
+from pytonconnect.crypto import SessionKeyPool
 from pytonconnect.exceptions import (ManifestContentError,
                                      ManifestNotFoundError,
                                      WalletAlreadyConnectedError,
                                      WalletNotConnectedError,
                                      WalletNotSupportFeatureError)
 from pytonconnect.logger import _LOGGER
-from pytonconnect.parsers import (ConnectEventParser, SendTransactionParser,
+from pytonconnect.parsers import (ChunkedTransactionResult, ConnectEventParser,
+                                  SendTransactionParser, TransactionChunkResult,
                                   TransactionMessage, WalletInfo)
-from pytonconnect.provider import BridgeProvider
+from pytonconnect.provider import (BridgeMultiplexer, BridgeProvider,
+                                   BridgeSelector, HttpClientPool,
+                                   ReconnectPolicy, UniversalLinkTemplate)
 from pytonconnect.storage import DefaultStorage, IStorage
 
+from ._connection_scheduler import ConnectionScheduler
+from ._events import ConnectionEvent, EventDispatcher, EventStream
 from ._wallets_list_manager import WalletsListManager
 
 
 class TonConnect:
 
+    VALID_UNTIL_GRACE = 60  # time in seconds to wait for the response after `valid_until` passes
+    DEFAULT_MAX_MESSAGES = 4  # chunk size when the wallet doesn't report maxMessages
+    DEFAULT_MAX_IN_FLIGHT = 1
+
     _wallets_list = WalletsListManager()
 
     _provider: BridgeProvider
     _manifest_url: str
     _storage: IStorage
     _api_tokens: dict[str, str]
+    _http_pool: HttpClientPool
+    _multiplexer: BridgeMultiplexer
+    _scheduler: ConnectionScheduler
+    _provider_options: dict
 
     _wallet: WalletInfo
 
     _status_change_subscriptions: list
     _status_change_error_subscriptions: list
+    _events: EventDispatcher
+    _event_subscriptions: list
 
     @property
     def connected(self):
@@ -51,6 +68,16 @@ class TonConnect:
             return None
         return self._provider._wallet.get('universal_url')
 
+    @property
+    def pending_requests_count(self) -> int:
+        """Number of requests waiting for the wallet response."""
+        return self._provider.pending_requests_count if self._provider is not None else 0
+
+    @property
+    def wallets_list(self) -> WalletsListManager:
+        """Wallets list manager, use it for indexed lookups (`get_wallet(app_name)`, `wallets_by_bridge(url)`)."""
+        return self._wallets_list
+
     def __init__(
         self,
         manifest_url: str,
@@ -58,33 +85,89 @@ class TonConnect:
         wallets_list_source: str = None,
         wallets_list_cache_ttl: int = None,
         api_tokens: dict[str, str] = None,
+        http_pool: HttpClientPool = None,
+        multiplexer: BridgeMultiplexer = None,
+        wallets_list: WalletsListManager = None,
+        storage_flush_policy: str = None,
+        storage_flush_delay: float = None,
+        scheduler: ConnectionScheduler = None,
+        request_timeout: float = None,
+        last_event_id_flush_events: int = None,
+        last_event_id_flush_interval: float = None,
+        reconnect_policy: ReconnectPolicy = None,
+        bridge_selector: BridgeSelector = None,
+        session_key_pool: SessionKeyPool = None,
     ):
-        if wallets_list_source is not None or wallets_list_cache_ttl is not None:
+        if wallets_list is not None:
+            self._wallets_list = wallets_list
+        elif wallets_list_source is not None or wallets_list_cache_ttl is not None:
             self._wallets_list = WalletsListManager(
                 wallets_list_source=wallets_list_source,
-                cache_ttl=wallets_list_cache_ttl)
+                cache_ttl=wallets_list_cache_ttl,
+                http_pool=http_pool)
 
         self._provider = None
         self._manifest_url = manifest_url
         self._storage = storage or DefaultStorage()
         self._api_tokens = api_tokens or {}
+        self._http_pool = http_pool
+        self._multiplexer = multiplexer
+        self._scheduler = scheduler
+        self._provider_options = {}
+        if storage_flush_policy is not None:
+            self._provider_options['storage_flush_policy'] = storage_flush_policy
+        if storage_flush_delay is not None:
+            self._provider_options['storage_flush_delay'] = storage_flush_delay
+        if request_timeout is not None:
+            self._provider_options['request_timeout'] = request_timeout
+        if last_event_id_flush_events is not None:
+            self._provider_options['last_event_id_flush_events'] = last_event_id_flush_events
+        if last_event_id_flush_interval is not None:
+            self._provider_options['last_event_id_flush_interval'] = last_event_id_flush_interval
+        if reconnect_policy is not None:
+            self._provider_options['reconnect_policy'] = reconnect_policy
+        if bridge_selector is not None:
+            self._provider_options['bridge_selector'] = bridge_selector
+        if session_key_pool is not None:
+            self._provider_options['session_key_pool'] = session_key_pool
 
         self._wallet = None
 
         self._status_change_subscriptions = []
         self._status_change_error_subscriptions = []
+        self._events = EventDispatcher()
+        self._event_subscriptions = []  # status change callbacks which need the bridge connection open
 
     def get_wallets(self=None):
         """Return available wallets list."""
         return TonConnect._wallets_list.get_wallets() if self is None else self._wallets_list.get_wallets()
 
+    async def aget_wallets(self):
+        """Return available wallets list without blocking the event loop."""
+        return await self._wallets_list.aget_wallets()
+
     def on_status_change(self, callback, errors_handler=None):
         """Allows to subscribe to connection status changes and handle connection errors.
+        Callbacks may be async functions, they are run as tasks without blocking the bridge connection.
+        A lazily restored session opens its bridge connection, so wallet events are received.
 
         :param callback: will be called after connections status changes with actual wallet or None
         :param errors_handler: will be called with some instance of TonConnectError when connect error is received
         :return: unsubscribe callback
         """
+        remove_subscription = self._add_status_change_subscription(callback, errors_handler)
+        subscription = object()
+        self._event_subscriptions.append(subscription)
+        self._listen_events()
+
+        def unsubscribe():
+            if subscription in self._event_subscriptions:
+                self._event_subscriptions.remove(subscription)
+            remove_subscription()
+
+        return unsubscribe
+
+    def _add_status_change_subscription(self, callback, errors_handler=None):
         self._status_change_subscriptions.append(callback)
         if errors_handler is not None:
             self._status_change_error_subscriptions.append(errors_handler)
@@ -97,6 +180,21 @@ class TonConnect:
 
         return unsubscribe
 
+    def events(self, maxsize: int = EventDispatcher.DEFAULT_MAXSIZE,
+               overflow: str = EventStream.OVERFLOW_DROP_OLDEST) -> EventStream:
+        """Subscribe to connection events, use as `async for event in connector.events()`.
+        Events are ConnectionEvent with type 'connect', 'connect_error' or 'disconnect'.
+        A lazily restored session opens its bridge connection, so wallet events are received.
+
+        :param maxsize: maximum number of unread events, 0 is unlimited
+        :param overflow: what to do when the queue is full: 'drop_oldest', 'drop_newest'
+            or 'error' (the iteration raises EventsOverflowError)
+        :return: event stream, call its `close()` (or use `async with`) to unsubscribe
+        """
+        stream = self._events.subscribe(maxsize, overflow)
+        self._listen_events()
+        return stream
+
     async def connect(self, wallet, request=None):
         """Generates universal link for an external wallet and subscribes to the wallet's bridge,
         or sends connect request to the injected wallet.
@@ -105,24 +203,65 @@ class TonConnect:
         :param request: additional request to pass to the wallet while connect (currently only ton_proof is available).
         :return: universal link if external wallet was passed.
         """
+        link_template = UniversalLinkTemplate.for_wallet(wallet, self._create_connect_request(request))
+        return await self._connect(wallet, link_template)
+
+    async def connect_many(self, wallets: list, request=None) -> list:
+        """Generates universal links of several external wallets for one session, so the user can choose
+        the wallet. Each distinct bridge is listened once, the first wallet to connect wins
+        and the other bridges are not listened anymore, `wallet` is the connected one then.
+
+        :param wallets: wallets' bridge urls and universal links.
+        :param request: additional request to pass to the wallet while connect (currently only ton_proof is available).
+        :return: universal links in the order of `wallets`, None for wallets without an SSE bridge.
+            TonConnectError is raised if none of the wallets has one.
+        """
         if self.connected:
             raise WalletAlreadyConnectedError()
 
         if self._provider:
             self._provider.close_connection()
 
-        self._provider = self._create_provider(wallet)
+        self._provider = self._create_provider({})
+        self._touch()
+
+        return await self._provider.connect_many(wallets, self._create_connect_request(request))
 
-        return await self._provider.connect(self._create_connect_request(request))
+    async def restore_pending_connection(self, auto_listen=True) -> bool:
+        """Listen again for the wallet answer to a connect link generated earlier
+        (by `connect` or `connect_many` before a restart or by `TonConnectHub.generate_connect_links`).
+
+        :param auto_listen: open the bridge connection at once, see `restore_connection`
+        :return: True if a pending connect is found
+        """
+        if self.connected:
+            raise WalletAlreadyConnectedError()
+
+        if self._provider:
+            self._provider.close_connection()
+
+        self._provider = BridgeProvider(self._storage, api_tokens=self._api_tokens, http_pool=self._http_pool,
+                                        multiplexer=self._multiplexer, **self._provider_options)
+        self._provider.listen(self._wallet_events_listener)
+        is_restored = await self._provider.restore_pending_connection(auto_listen)
+        if is_restored and auto_listen:
+            self._touch()
+        return is_restored
 
     async def restore_connection(self, auto_listen=True):
         """Try to restore existing session and reconnect to the corresponding wallet.
         Call it immediately when your app is loaded.
 
+        :param auto_listen: open the bridge connection at once. If False (lazy restore) the session is restored
+            from the storage without any network activity, the bridge connection is opened by the first request,
+            `unpause_connection()`, `wake()` or a subscription to events (`on_status_change`, `events`) and resumes
+            from the stored last event id, so wallet events sent in between are delivered (as long as the bridge
+            still keeps them). If events are subscribed before the restore, the connection is opened at once.
         :return: True if connection is restored
         """
         try:
-            self._provider = BridgeProvider(self._storage, api_tokens=self._api_tokens)
+            self._provider = BridgeProvider(self._storage, api_tokens=self._api_tokens, http_pool=self._http_pool,
+                                            multiplexer=self._multiplexer, **self._provider_options)
         except Exception:
             await self._storage.remove_item(IStorage.KEY_CONNECTION)
             self._provider = None
@@ -131,7 +270,11 @@ class TonConnect:
             return False
 
         self._provider.listen(self._wallet_events_listener)
-        return await self._provider.restore_connection(auto_listen)
+        auto_listen = auto_listen or self._events_subscribed
+        is_restored = await self._provider.restore_connection(auto_listen)
+        if is_restored and auto_listen:
+            self._touch()
+        return is_restored
 
     async def send_transaction(self, transaction: dict) -> dict:
         """Asks connected wallet to sign and send the transaction.
@@ -139,6 +282,8 @@ class TonConnect:
         :param transaction: transaction to send.
         :return: signed transaction boc that allows you to find the transaction in the blockchain.
         If user rejects transaction, method will throw the corresponding error.
+        If the wallet doesn't respond until `valid_until` (or the request timeout of the connector
+        if `valid_until` is not set), RequestTimeoutError is raised.
         """
         if not self.connected:
             raise WalletNotConnectedError()
@@ -160,13 +305,72 @@ class TonConnect:
             'messages': messages,
         }
 
-        response = await self._provider.send_request(SendTransactionParser.convert_to_rpc_request(request))
+        timeout = None
+        if request['valid_until']:
+            timeout = request['valid_until'] - time.time() + self.VALID_UNTIL_GRACE
+
+        # a connection paused by the scheduler is resumed by send_request
+        self._touch()
+        response = await self._provider.send_request(SendTransactionParser.convert_to_rpc_request(request),
+                                                     timeout=timeout)
 
         if SendTransactionParser.is_error(response):
             return SendTransactionParser.parse_and_throw_error(response)
 
         return SendTransactionParser.convert_from_rpc_response(response)
 
+    async def send_transactions_chunked(self,
+                                        transaction: dict,
+                                        max_messages: int = None,
+                                        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+                                        stop_on_error: bool = False) -> ChunkedTransactionResult:
+        """Sends messages of the transaction in as many transactions as the wallet requires.
+        Messages are split into chunks of the wallet's `maxMessages` in their order, up to `max_in_flight`
+        requests are sent to the wallet without waiting for the previous responses.
+        Every chunk is a separate transaction confirmed by the user, chunks are not atomic together.
+        Transactions of one wallet are ordered by its seqno: requests sent in parallel may be built
+        on the same seqno and all but one of them fail, so chunks are sent one by one by default.
+
+        :param transaction: transaction to send, its `valid_until`, `from` and `network` are used for all chunks.
+        :param max_messages: chunk size, the wallet's `maxMessages` by default.
+        :param max_in_flight: maximum number of requests waiting for the wallet response,
+            more than 1 only for wallets that queue requests themselves.
+        :param stop_on_error: don't send the chunks left after a chunk fails, they are reported as skipped.
+        :return: result of every chunk, failed chunks keep their error instead of raising it.
+            Chunks which timed out are reported apart (`unknown`), the wallet may still send them.
+        """
+        if not self.connected:
+            raise WalletNotConnectedError()
+
+        messages = transaction.get('messages', [])
+        if not isinstance(messages, list):
+            messages = [messages]
+
+        wallet_max_messages = self._get_max_messages(self._wallet.device.features)
+        chunk_size = min(max_messages or wallet_max_messages, wallet_max_messages)
+        self._check_send_transaction_support(self._wallet.device.features, {'required_messages_number': chunk_size})
+
+        chunks = [TransactionChunkResult(index=i, messages=messages[start:start + chunk_size])
+                  for i, start in enumerate(range(0, len(messages), chunk_size))]
+        semaphore = asyncio.Semaphore(max_in_flight)
+        failed = False
+
+        async def send_chunk(chunk: TransactionChunkResult):
+            nonlocal failed
+            async with semaphore:
+                if failed and stop_on_error:
+                    return
+                try:
+                    response = await self.send_transaction(dict(transaction, messages=chunk.messages))
+                    chunk.boc = response['boc']
+                except Exception as e:
+                    _LOGGER.debug(f'Transaction chunk {chunk.index} failed {type(e)}: {e}')
+                    chunk.error = e
+                    failed = True
+
+        await asyncio.gather(*[send_chunk(chunk) for chunk in chunks])
+        return ChunkedTransactionResult(chunks)
+
     async def disconnect(self):
         """Disconnect from wallet and drop current session."""
         if not self.connected:
@@ -179,12 +383,33 @@ class TonConnect:
         """Pause bridge HTTP connection.
         Might be helpful, if you use SDK on backend and want to save server resources.
         """
+        self._forget()
         self._provider.pause()
 
     async def unpause_connection(self):
         """Unpause bridge HTTP connection if it is paused."""
+        self._touch()
         await self._provider.unpause()
 
+    async def wake(self):
+        """Resume bridge HTTP connection if it was paused (by the scheduler), an open connection is kept."""
+        if self._provider is None:
+            return
+        if self._scheduler is not None:
+            await self._scheduler.wake(self)
+        else:
+            await self._provider.ensure_listening()
+
+    async def close(self):
+        """Pause bridge HTTP connection, close event streams and write pending session changes to the storage.
+        The session is kept and can be restored later.
+        """
+        self._forget()
+        self._events.close()
+        if self._provider is not None:
+            self._provider.pause()
+            await self._provider.flush()
+
     def wait_for_connection(self):
         wait_resolve = asyncio.get_running_loop().create_future()
         if self.connected:
@@ -199,7 +424,8 @@ class TonConnect:
             wait_resolve.set_result(e)
             unsubscribe()
 
-        unsubscribe = self.on_status_change(status_changed, status_error)
+        # the connection being established is listened anyway, a lazily restored one is connected already
+        unsubscribe = self._add_status_change_subscription(status_changed, status_error)
 
         return wait_resolve
 
@@ -225,12 +451,61 @@ class TonConnect:
             _LOGGER.warning("Connected wallet didn't provide information about max allowed messages "
                             "in the SendTransaction request. Request may be rejected by the wallet.")
 
+    def _get_max_messages(self, features) -> int:
+        for feature in features:
+            if isinstance(feature, dict) and feature.get('name') == 'SendTransaction' \
+                    and feature.get('maxMessages'):
+                return feature['maxMessages']
+        return self.DEFAULT_MAX_MESSAGES
+
+    async def _connect(self, wallet: dict, link_template: UniversalLinkTemplate) -> str:
+        if self.connected:
+            raise WalletAlreadyConnectedError()
+
+        if self._provider:
+            self._provider.close_connection()
+
+        self._provider = self._create_provider(wallet)
+        self._touch()
+
+        return await self._provider.connect_with_template(link_template)
+
     def _create_provider(self, wallet: dict) -> BridgeProvider:
-        provider = BridgeProvider(self._storage, wallet, api_tokens=self._api_tokens)
+        provider = BridgeProvider(self._storage, wallet, api_tokens=self._api_tokens, http_pool=self._http_pool,
+                                  multiplexer=self._multiplexer, **self._provider_options)
         provider.listen(self._wallet_events_listener)
         return provider
 
+    @property
+    def _events_subscribed(self) -> bool:
+        # a lazily restored session is opened at once while anyone is subscribed to its events
+        return bool(self._event_subscriptions) or self._events.streams_count > 0
+
+    def _listen_events(self):
+        # subscribed events are only received over an open bridge connection
+        if not self.connected or self._provider is None or self._provider._gateway is None \
+                or self._provider._gateway.is_listening:
+            return
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return  # restored later, the restore opens the connection
+        self._events.call(self.wake)
+
+    def _touch(self):
+        if self._scheduler is not None:
+            self._scheduler.touch(self)
+
+    def _forget(self):
+        if self._scheduler is not None:
+            self._scheduler.forget(self)
+
     def _wallet_events_listener(self, data):
+        # events replayed by a lazy restore are not an activity, the connection is not open
+        gateway = self._provider._gateway if self._provider is not None else None
+        if gateway is not None and gateway.is_listening:
+            self._touch()
+
         if data['event'] == 'connect':
             self._on_wallet_connected(data['payload'])
 
@@ -242,25 +517,33 @@ class TonConnect:
 
     def _on_wallet_connected(self, payload):
         self._wallet = ConnectEventParser.parse_response(payload)
-        for listener in self._status_change_subscriptions:
-            listener(self._wallet)
+        self._events.emit(ConnectionEvent('connect', wallet=self._wallet))
+        for listener in self._status_change_subscriptions.copy():
+            self._events.call(listener, self._wallet)
 
     def _on_wallet_connect_error(self, payload):
         _LOGGER.debug('connect error %s', payload)
         error = ConnectEventParser.parse_error(payload)
-        for listener in self._status_change_error_subscriptions:
-            listener(error)
+        self._events.emit(ConnectionEvent('connect_error', error=error))
+        for listener in self._status_change_error_subscriptions.copy():
+            self._events.call(listener, error)
 
         if isinstance(error, (ManifestNotFoundError, ManifestContentError)):
             _LOGGER.exception(error)
             raise error
 
     def _on_wallet_disconnected(self):
+        self._forget()
         self._wallet = None
-        for listener in self._status_change_subscriptions:
-            listener(None)
+        self._events.emit(ConnectionEvent('disconnect'))
+        for listener in self._status_change_subscriptions.copy():
+            self._events.call(listener, None)
 
     def _create_connect_request(self, request):
+        return self._build_connect_request(self._manifest_url, request)
+
+    @staticmethod
+    def _build_connect_request(manifest_url: str, request):
         items = [
             {
                 'name': 'ton_addr',
@@ -274,6 +557,6 @@ class TonConnect:
             })
 
         return {
-            'manifestUrl': self._manifest_url,
+            'manifestUrl': manifest_url,
             'items': items,
         }
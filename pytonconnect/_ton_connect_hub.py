@@ -0,0 +1,297 @@
+import asyncio
+from functools import partial
+
+from pytonconnect.crypto import SessionKeyPool
+from pytonconnect.provider import (BridgeMultiplexer, BridgeProvider,
+                                   BridgeSelector, HttpClientPool,
+                                   ReconnectPolicy, UniversalLinkTemplate)
+from pytonconnect.storage import (DefaultStorage, IStorage, NamespacedStorage,
+                                  SqliteStorage)
+
+from ._bulk_restore import restore_connections
+from ._connection_scheduler import ConnectionScheduler
+from ._events import ConnectionEvent, EventDispatcher, EventStream
+from ._ton_connect import TonConnect
+from ._wallets_list_manager import WalletsListManager
+
+
+class TonConnectHub:
+    """Owns TonConnect sessions of many users in one process.
+
+    All sessions share the wallets list, the HTTP clients, the bridge streams (via BridgeMultiplexer)
+    and the storage backend, where every user gets its own key namespace.
+    Connectors are created on demand, so an idle user costs nothing but its stored session.
+    Pass a ConnectionScheduler to pause bridge connections of idle users and cap the number of open connections.
+    """
+
+    DEFAULT_RESTORE_CONCURRENCY = 100
+    DEFAULT_LINKS_BATCH_SIZE = 100
+
+    _manifest_url: str
+    _storage: IStorage
+    _api_tokens: dict[str, str]
+    _wallets_list: WalletsListManager
+    _http_pool: HttpClientPool
+    _multiplexer: BridgeMultiplexer
+    _storage_flush_policy: str
+    _storage_flush_delay: float
+    _scheduler: ConnectionScheduler
+    _request_timeout: float
+    _last_event_id_flush_events: int
+    _last_event_id_flush_interval: float
+    _reconnect_policy: ReconnectPolicy
+    _bridge_selector: BridgeSelector
+    _session_key_pool: SessionKeyPool
+
+    _connectors: dict
+
+    _status_change_subscriptions: list
+    _status_change_error_subscriptions: list
+    _events: EventDispatcher
+
+    @property
+    def wallets_list(self) -> WalletsListManager:
+        """Wallets list manager, use it for indexed lookups (`get_wallet(app_name)`, `wallets_by_bridge(url)`)."""
+        return self._wallets_list
+
+    def __init__(
+        self,
+        manifest_url: str,
+        storage: IStorage = None,
+        wallets_list_source: str = None,
+        wallets_list_cache_ttl: int = None,
+        api_tokens: dict[str, str] = None,
+        http_pool: HttpClientPool = None,
+        multiplexer: BridgeMultiplexer = None,
+        storage_flush_policy: str = None,
+        storage_flush_delay: float = None,
+        scheduler: ConnectionScheduler = None,
+        request_timeout: float = None,
+        last_event_id_flush_events: int = None,
+        last_event_id_flush_interval: float = None,
+        reconnect_policy: ReconnectPolicy = None,
+        bridge_selector: BridgeSelector = None,
+        session_key_pool: SessionKeyPool = None,
+    ):
+        self._manifest_url = manifest_url
+        self._storage = storage or DefaultStorage()
+        self._api_tokens = api_tokens or {}
+
+        self._http_pool = http_pool or HttpClientPool.default()
+
+        if wallets_list_source is not None or wallets_list_cache_ttl is not None:
+            self._wallets_list = WalletsListManager(
+                wallets_list_source=wallets_list_source,
+                cache_ttl=wallets_list_cache_ttl,
+                http_pool=self._http_pool)
+        else:
+            self._wallets_list = TonConnect._wallets_list
+        self._multiplexer = multiplexer or BridgeMultiplexer(http_pool=self._http_pool,
+                                                             reconnect_policy=reconnect_policy)
+
+        self._storage_flush_policy = storage_flush_policy
+        self._storage_flush_delay = storage_flush_delay
+        self._scheduler = scheduler
+        self._request_timeout = request_timeout
+        self._last_event_id_flush_events = last_event_id_flush_events
+        self._last_event_id_flush_interval = last_event_id_flush_interval
+        self._reconnect_policy = reconnect_policy
+        self._bridge_selector = bridge_selector
+        self._session_key_pool = session_key_pool
+
+        self._connectors = {}
+
+        self._status_change_subscriptions = []
+        self._status_change_error_subscriptions = []
+        self._events = EventDispatcher()
+
+    def __contains__(self, user_id):
+        return user_id in self._connectors
+
+    def __len__(self):
+        return len(self._connectors)
+
+    def get(self, user_id) -> TonConnect:
+        """Return the connector of the user, creating it if needed.
+
+        :param user_id: any hashable user identifier, its string form is used as storage namespace
+        """
+        connector = self._connectors.get(user_id)
+        if connector is None:
+            connector = self._connectors[user_id] = self._create_connector(user_id)
+        return connector
+
+    async def remove(self, user_id):
+        """Close the user's connection and forget the connector. Stored session is kept."""
+        connector = self._connectors.pop(user_id, None)
+        if connector is not None:
+            await connector.close()
+
+    def get_wallets(self):
+        """Return available wallets list."""
+        return self._wallets_list.get_wallets()
+
+    async def aget_wallets(self):
+        """Return available wallets list without blocking the event loop."""
+        return await self._wallets_list.aget_wallets()
+
+    def on_status_change(self, callback, errors_handler=None):
+        """Allows to subscribe to connection status changes of all users.
+        Callbacks may be async functions, they are run as tasks without blocking the bridge connections.
+
+        :param callback: will be called as `callback(user_id, wallet_info)`, wallet_info is None on disconnect
+        :param errors_handler: will be called as `errors_handler(user_id, error)` when connect error is received
+        :return: unsubscribe callback
+        """
+        self._status_change_subscriptions.append(callback)
+        if errors_handler is not None:
+            self._status_change_error_subscriptions.append(errors_handler)
+
+        def unsubscribe():
+            if callback in self._status_change_subscriptions:
+                self._status_change_subscriptions.remove(callback)
+            if errors_handler is not None and errors_handler in self._status_change_error_subscriptions:
+                self._status_change_error_subscriptions.remove(errors_handler)
+
+        return unsubscribe
+
+    def events(self, maxsize: int = EventDispatcher.DEFAULT_MAXSIZE,
+               overflow: str = EventStream.OVERFLOW_DROP_OLDEST) -> EventStream:
+        """Subscribe to connection events of all users, see `TonConnect.events`.
+        Events have `user_id` set.
+        """
+        return self._events.subscribe(maxsize, overflow)
+
+    async def restore_all(self,
+                          user_ids,
+                          concurrency: int = DEFAULT_RESTORE_CONCURRENCY,
+                          auto_listen=True,
+                          ramp_rate: float = None,
+                          on_progress=None) -> dict:
+        """Restore stored sessions of the users, see `restore_connections`.
+        Users without a stored session are not kept in the hub.
+
+        :param user_ids: users to restore
+        :param concurrency: maximum number of sessions restored at the same time
+        :param auto_listen: open bridge connections at once, see `TonConnect.restore_connection`
+        :param ramp_rate: maximum number of connections opened per second to one bridge, None is unlimited
+        :param on_progress: will be called with RestoreProgress after every restored session
+        :return: dict of user_id -> True if connection is restored
+        """
+        connectors = {user_id: self.get(user_id) for user_id in user_ids}
+        results = await restore_connections(connectors, concurrency=concurrency, ramp_rate=ramp_rate,
+                                            on_progress=on_progress, auto_listen=auto_listen)
+
+        for user_id, is_restored in results.items():
+            if not is_restored:
+                self._connectors.pop(user_id, None)
+        return results
+
+    async def generate_connect_links(self, user_ids, wallet: dict, request=None, listen=False,
+                                     batch_size: int = DEFAULT_LINKS_BATCH_SIZE):
+        """Generate connect links of the wallet for many users, e.g. for a broadcast.
+        The connect request is encoded once for all links, a pending connect is stored for every user.
+        Users with a connected session keep it, their link is None.
+
+        :param user_ids: users to generate links for
+        :param wallet: wallet's bridge url and universal link
+        :param request: additional request to pass to the wallet while connect, see `TonConnect.connect`
+        :param listen: listen for the wallet answers at once, users' connectors are kept in the hub.
+            If False only the pending connects are stored, `hub.get(user_id).restore_pending_connection()`
+            starts listening later. Users whose connector is already kept in the hub get the link
+            through it, so their pending connect is listened anyway
+        :param batch_size: number of links generated at once, subscriptions of a batch share stream restarts
+        :return: async generator of `(user_id, universal link or None)`
+        """
+        link_template = UniversalLinkTemplate.for_wallet(
+            wallet, TonConnect._build_connect_request(self._manifest_url, request))
+
+        batch = []
+        for user_id in user_ids:
+            batch.append(user_id)
+            if len(batch) >= batch_size:
+                for item in await self._generate_connect_links_batch(batch, wallet, link_template, listen):
+                    yield item
+                batch = []
+        if batch:
+            for item in await self._generate_connect_links_batch(batch, wallet, link_template, listen):
+                yield item
+
+    async def close(self):
+        """Close all bridge streams and event streams of the hub and write pending session changes.
+        Stored sessions are kept.
+        """
+        self._events.close()
+        connectors, self._connectors = self._connectors, {}
+        for connector in connectors.values():
+            await connector.close()
+        self._multiplexer.close()
+
+    async def _generate_connect_links_batch(self, user_ids: list, wallet: dict,
+                                            link_template: UniversalLinkTemplate, listen: bool) -> list:
+        return await asyncio.gather(*[self._generate_connect_link(user_id, wallet, link_template, listen)
+                                      for user_id in user_ids])
+
+    async def _generate_connect_link(self, user_id, wallet: dict, link_template: UniversalLinkTemplate,
+                                     listen: bool) -> tuple:
+        connector = self._connectors.get(user_id)
+        provider = self._create_provider(user_id, wallet)
+        if (connector is not None and connector.connected) or await provider.has_stored_connection():
+            return user_id, None
+
+        # a live connector replaces its own pending connect, a bare provider would overwrite it under the connector
+        if listen or connector is not None:
+            return user_id, await self.get(user_id)._connect(wallet, link_template)
+        return user_id, await provider.connect_with_template(link_template, auto_listen=False)
+
+    def _get_user_storage(self, user_id) -> IStorage:
+        if isinstance(self._storage, SqliteStorage):
+            return self._storage.with_namespace(str(user_id))
+        return NamespacedStorage(self._storage, str(user_id))
+
+    def _create_connector(self, user_id) -> TonConnect:
+        connector = TonConnect(
+            self._manifest_url,
+            storage=self._get_user_storage(user_id),
+            api_tokens=self._api_tokens,
+            http_pool=self._http_pool,
+            multiplexer=self._multiplexer,
+            wallets_list=self._wallets_list,
+            storage_flush_policy=self._storage_flush_policy,
+            storage_flush_delay=self._storage_flush_delay,
+            scheduler=self._scheduler,
+            request_timeout=self._request_timeout,
+            last_event_id_flush_events=self._last_event_id_flush_events,
+            last_event_id_flush_interval=self._last_event_id_flush_interval,
+            reconnect_policy=self._reconnect_policy,
+            bridge_selector=self._bridge_selector,
+            session_key_pool=self._session_key_pool,
+        )
+        # the hub's own subscription keeps lazily restored sessions lazy
+        connector._add_status_change_subscription(partial(self._on_status_change, user_id),
+                                                  partial(self._on_status_change_error, user_id))
+        return connector
+
+    def _create_provider(self, user_id, wallet: dict) -> BridgeProvider:
+        # a bare provider stores a pending connect without the connector around it
+        options = {
+            'storage_flush_policy': self._storage_flush_policy,
+            'storage_flush_delay': self._storage_flush_delay,
+            'reconnect_policy': self._reconnect_policy,
+            'bridge_selector': self._bridge_selector,
+            'session_key_pool': self._session_key_pool,
+        }
+        return BridgeProvider(self._get_user_storage(user_id), wallet, api_tokens=self._api_tokens,
+                              http_pool=self._http_pool, multiplexer=self._multiplexer,
+                              **{name: value for name, value in options.items() if value is not None})
+
+    def _on_status_change(self, user_id, wallet_info):
+        event_type = 'connect' if wallet_info is not None else 'disconnect'
+        self._events.emit(ConnectionEvent(event_type, wallet=wallet_info, user_id=user_id))
+        for listener in self._status_change_subscriptions.copy():
+            self._events.call(listener, user_id, wallet_info)
+
+    def _on_status_change_error(self, user_id, error):
+        self._events.emit(ConnectionEvent('connect_error', error=error, user_id=user_id))
+        for listener in self._status_change_error_subscriptions.copy():
+            self._events.call(listener, user_id, error)
@@ -1,9 +1,15 @@
+import asyncio
+import json
+import os
 from datetime import datetime
+from hashlib import sha256
+from pathlib import Path
 
 import httpx
 
 from pytonconnect.exceptions import FetchWalletsError
 from pytonconnect.logger import _LOGGER
+from pytonconnect.provider import HttpClientPool
 
 FALLBACK_WALLETS_LIST = [
     {
@@ -60,44 +66,234 @@ class WalletsListManager:
 
     _wallets_list_source = 'https://raw.githubusercontent.com/ton-blockchain/wallets-list/main/wallets-v2.json'
     _cache_ttl: int
+    _http_pool: HttpClientPool
+    _snapshot_path: Path
 
+    _wallets_list_raw: list
     _wallets_list_cache: dict
+    _body_hash: str
+    _wallets_by_app_name: dict
+    _wallets_by_name: dict
+    _wallets_by_bridge_url: dict
+    _wallets_by_platform: dict
     _wallets_list_cache_creation_timestamp: int
+    _etag: str
+    _last_modified: str
+    _refresh_task: asyncio.Task
+    _revalidate_snapshot: bool
 
-    def __init__(self, wallets_list_source=None, cache_ttl=None):
+    def __init__(self, wallets_list_source=None, cache_ttl=None, http_pool: HttpClientPool = None,
+                 snapshot_path: str = None):
+        """
+        :param wallets_list_source: url of the wallets list
+        :param cache_ttl: time in seconds to use the fetched list before refreshing it, None is forever
+        :param http_pool: HTTP clients for async fetches, process-wide pool by default
+        :param snapshot_path: file to keep the last fetched list, it is loaded on start without network
+            and refreshed in background by `aget_wallets`
+        """
         if wallets_list_source:
             self._wallets_list_source = wallets_list_source
         self._cache_ttl = cache_ttl
+        self._http_pool = http_pool
+        self._snapshot_path = Path(snapshot_path) if snapshot_path else None
 
+        self._wallets_list_raw = None
         self._wallets_list_cache = None
+        self._body_hash = None
+        self._wallets_by_app_name = {}
+        self._wallets_by_name = {}
+        self._wallets_by_bridge_url = {}
+        self._wallets_by_platform = {}
         self._wallets_list_cache_creation_timestamp = None
+        self._etag = None
+        self._last_modified = None
+        self._refresh_task = None
+        self._revalidate_snapshot = False
+
+        if self._snapshot_path is not None:
+            self._load_snapshot()
 
     def get_wallets(self):
-        if self._cache_ttl \
-                and self._wallets_list_cache_creation_timestamp \
-                and int(datetime.now().timestamp()) > self._wallets_list_cache_creation_timestamp + self._cache_ttl:
-            self._wallets_list_cache = None
+        if not self._wallets_list_cache or self._is_cache_expired():
+            if self._update_wallets_list(self._fetch_wallets_list):
+                self._save_snapshot()
+
+        return self._wallets_list_cache
 
+    async def aget_wallets(self):
+        """Return wallets list without blocking the event loop.
+        Expired list is returned at once and refreshed in background, only the first call waits for the fetch.
+        """
         if not self._wallets_list_cache:
-            wallets_list = None
-            try:
-                wallets_list = httpx.get(self._wallets_list_source).json()
-                if not isinstance(wallets_list, list):
-                    raise FetchWalletsError('Wrong wallets list format, wallets list must be an array.')
+            await asyncio.shield(self._start_refresh())
+        elif self._is_cache_expired() or self._revalidate_snapshot:
+            self._start_refresh()
+
+        return self._wallets_list_cache
 
-            except Exception as e:
-                _LOGGER.error(f'WalletsListManager get_wallets {type(e)}: {e}')
-                wallets_list = FALLBACK_WALLETS_LIST
+    def get_wallet(self, app_name: str):
+        """Return the wallet by its `app_name` or None."""
+        self._ensure_loaded()
+        return self._wallets_by_app_name.get(app_name)
 
-            self._wallets_list_cache = []
-            for wallet in wallets_list:
-                supported_wallet = self._get_supported_wallet_config(wallet)
-                if supported_wallet:
-                    self._wallets_list_cache.append(supported_wallet)
+    def get_wallet_by_name(self, name: str):
+        """Return the wallet by its display `name` or None."""
+        self._ensure_loaded()
+        return self._wallets_by_name.get(name)
 
-            self._wallets_list_cache_creation_timestamp = int(datetime.now().timestamp())
+    def wallets_by_bridge(self, bridge_url: str) -> list:
+        """Return wallets connected through the bridge."""
+        self._ensure_loaded()
+        return self._wallets_by_bridge_url.get(bridge_url.rstrip('/'), [])
 
-        return self._wallets_list_cache
+    def wallets_by_platform(self, platform: str) -> list:
+        """Return wallets available on the platform (e.g. 'ios', 'android', 'chrome')."""
+        self._ensure_loaded()
+        return self._wallets_by_platform.get(platform, [])
+
+    def _ensure_loaded(self):
+        # lookups use the list loaded by get_wallets/aget_wallets, the list is fetched only if nothing is loaded
+        if self._wallets_list_cache is None:
+            self.get_wallets()
+
+    def _is_cache_expired(self):
+        return self._cache_ttl \
+            and self._wallets_list_cache_creation_timestamp \
+            and int(datetime.now().timestamp()) > self._wallets_list_cache_creation_timestamp + self._cache_ttl
+
+    def _start_refresh(self) -> asyncio.Task:
+        # single-flight: concurrent callers share one fetch
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.get_running_loop().create_task(self._refresh())
+        return self._refresh_task
+
+    async def _refresh(self):
+        try:
+            response = await self._get_http_pool().get_client(self._wallets_list_source) \
+                .get(self._wallets_list_source, headers=self._get_conditional_headers())
+        except Exception as e:
+            response = e
+        if self._update_wallets_list(lambda: self._parse_response(response)) and self._snapshot_path is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self._save_snapshot)
+
+    def _fetch_wallets_list(self):
+        return self._parse_response(httpx.get(self._wallets_list_source, headers=self._get_conditional_headers()))
+
+    def _update_wallets_list(self, fetch) -> bool:
+        """Fetch and apply the list, return True if it came from the source (or is not modified there)."""
+        # a failed fetch is retried when the list expires, not on every call
+        self._revalidate_snapshot = False
+        try:
+            wallets_list = fetch()
+        except Exception as e:
+            _LOGGER.error(f'WalletsListManager get_wallets {type(e)}: {e}')
+            # keep serving the stale list until the next refresh
+            wallets_list = None if self._wallets_list_cache else FALLBACK_WALLETS_LIST
+            is_fetched = False
+        else:
+            is_fetched = True
+
+        if wallets_list is not None:
+            self._set_wallets_list(wallets_list)
+        self._wallets_list_cache_creation_timestamp = int(datetime.now().timestamp())
+        return is_fetched
+
+    def _parse_response(self, response: httpx.Response):
+        """Return wallets list from the response or None if the cached one is not modified."""
+        if isinstance(response, Exception):
+            raise response
+
+        if response.status_code == 304 and self._wallets_list_cache:
+            return None
+
+        response.raise_for_status()
+        # a source without validators sends the same body again, it is not parsed and validated twice
+        body_hash = sha256(response.content).hexdigest()
+        if body_hash == self._body_hash and self._wallets_list_cache:
+            return None
+
+        wallets_list = response.json()
+        if not isinstance(wallets_list, list):
+            raise FetchWalletsError('Wrong wallets list format, wallets list must be an array.')
+
+        self._etag = response.headers.get('ETag')
+        self._last_modified = response.headers.get('Last-Modified')
+        self._body_hash = body_hash
+        return wallets_list
+
+    def _set_wallets_list(self, wallets_list: list):
+        wallets_list_cache = []
+        by_app_name, by_name, by_bridge_url, by_platform = {}, {}, {}, {}
+
+        for wallet in wallets_list:
+            supported_wallet = self._get_supported_wallet_config(wallet)
+            if not supported_wallet:
+                continue
+
+            wallets_list_cache.append(supported_wallet)
+            if supported_wallet['app_name'] is not None:
+                by_app_name.setdefault(supported_wallet['app_name'], supported_wallet)
+            by_name.setdefault(supported_wallet['name'], supported_wallet)
+            for bridge_url in supported_wallet['bridge_urls']:
+                by_bridge_url.setdefault(bridge_url.rstrip('/'), []).append(supported_wallet)
+            for platform in wallet.get('platforms') or []:
+                by_platform.setdefault(platform, []).append(supported_wallet)
+
+        self._wallets_list_raw = wallets_list
+        self._wallets_list_cache = wallets_list_cache
+        self._wallets_by_app_name = by_app_name
+        self._wallets_by_name = by_name
+        self._wallets_by_bridge_url = by_bridge_url
+        self._wallets_by_platform = by_platform
+
+    def _get_conditional_headers(self) -> dict:
+        headers = {}
+        if self._wallets_list_cache:
+            if self._etag:
+                headers['If-None-Match'] = self._etag
+            if self._last_modified:
+                headers['If-Modified-Since'] = self._last_modified
+        return headers
+
+    def _get_http_pool(self) -> HttpClientPool:
+        return self._http_pool or HttpClientPool.default()
+
+    def _load_snapshot(self):
+        try:
+            snapshot = json.loads(self._snapshot_path.read_text())
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            _LOGGER.warning(f'WalletsListManager snapshot {self._snapshot_path} is broken {type(e)}: {e}')
+            return
+
+        if not isinstance(snapshot, dict) or snapshot.get('source') != self._wallets_list_source \
+                or not isinstance(snapshot.get('wallets'), list):
+            return
+
+        self._set_wallets_list(snapshot['wallets'])
+        self._wallets_list_cache_creation_timestamp = snapshot.get('fetched_at')
+        self._etag = snapshot.get('etag')
+        self._last_modified = snapshot.get('last_modified')
+        self._revalidate_snapshot = True
+
+    def _save_snapshot(self):
+        if self._snapshot_path is None or self._wallets_list_raw is None:
+            return
+
+        snapshot = {
+            'source': self._wallets_list_source,
+            'fetched_at': self._wallets_list_cache_creation_timestamp,
+            'etag': self._etag,
+            'last_modified': self._last_modified,
+            'wallets': self._wallets_list_raw,
+        }
+        tmp_path = self._snapshot_path.with_name(self._snapshot_path.name + '.tmp')
+        try:
+            tmp_path.write_text(json.dumps(snapshot))
+            os.replace(tmp_path, self._snapshot_path)
+        except Exception as e:
+            _LOGGER.error(f'WalletsListManager save snapshot {self._snapshot_path} {type(e)}: {e}')
 
     def _get_supported_wallet_config(self, wallet):
         if not isinstance(wallet, dict):
@@ -124,16 +320,20 @@ class WalletsListManager:
             'app_name': wallet.get('app_name'),
         }
 
+        bridge_urls = []
         for bridge in wallet['bridge']:
             if bridge['type'] == 'sse':
                 if 'url' not in bridge:
                     _LOGGER.warning(f'Not supported wallet: bridge url not found, config -> {wallet}')
                     return None
+                bridge_urls.append(bridge['url'])
 
-                walletConfig['bridge_url'] = bridge['url']
-                if 'universal_url' in wallet:
-                    walletConfig['universal_url'] = wallet['universal_url']
-                break
+        if bridge_urls:
+            # the first bridge is the preferred one, the others are used by providers for failover
+            walletConfig['bridge_url'] = bridge_urls[0]
+            walletConfig['bridge_urls'] = bridge_urls
+            if 'universal_url' in wallet:
+                walletConfig['universal_url'] = wallet['universal_url']
 
         if 'bridge_url' not in walletConfig:
             _LOGGER.warning(f'Not supported wallet: sse not found, config -> {wallet}')
@@ -1,5 +1,7 @@
 from ._session_crypto import SessionCrypto
+from ._session_key_pool import SessionKeyPool
 
 __all__ = [
     'SessionCrypto',
+    'SessionKeyPool',
 ]
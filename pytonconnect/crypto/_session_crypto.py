@@ -1,4 +1,6 @@
+import threading
 from base64 import b64decode, b64encode
+from collections import OrderedDict
 
 from nacl.encoding import HexEncoder
 from nacl.public import Box, PrivateKey, PublicKey
@@ -7,21 +9,30 @@ from nacl.utils import random
 
 class SessionCrypto:
 
+    BOX_CACHE_SIZE = 16  # peers with a precomputed shared key kept per session
+
     key_pair: PrivateKey
     session_id: str
 
-    def __init__(self, private_key: str = None):
+    _box_cache_size: int
+    _boxes: OrderedDict
+    _boxes_lock: threading.Lock
+
+    def __init__(self, private_key: str = None, box_cache_size: int = BOX_CACHE_SIZE):
         self.key_pair = PrivateKey(private_key, HexEncoder) if private_key else PrivateKey.generate()
         self.session_id = self.key_pair.public_key.encode().hex()
 
+        self._box_cache_size = box_cache_size
+        self._boxes = OrderedDict()
+        self._boxes_lock = threading.Lock()  # messages may be decrypted in worker threads
+
     def create_nonce(self):
         return random(Box.NONCE_SIZE)
 
     def encrypt(self, message: str, receiver_pub_key_hex: str):
         nonce = self.create_nonce()
 
-        receiver_pk = PublicKey(receiver_pub_key_hex, HexEncoder)
-        box = Box(self.key_pair, receiver_pk)
+        box = self._get_box(receiver_pub_key_hex)
         encrypted = box.encrypt(message.encode('utf-8'), nonce)
 
         res = bytearray(nonce)
@@ -33,8 +44,28 @@ class SessionCrypto:
         nonce = msg[:Box.NONCE_SIZE]
         internal_message = msg[Box.NONCE_SIZE:]
 
-        sender_pk = PublicKey(sender_pub_key_hex, HexEncoder)
-        box = Box(self.key_pair, sender_pk)
+        box = self._get_box(sender_pub_key_hex)
 
         decrypted = box.decrypt(internal_message, nonce)
         return decrypted.decode('utf-8')
+
+    def forget_peer(self, pub_key_hex: str):
+        """Drop the precomputed shared key of the peer."""
+        with self._boxes_lock:
+            self._boxes.pop(pub_key_hex, None)
+
+    def _get_box(self, pub_key_hex: str) -> Box:
+        # Box computes the Curve25519 shared key on creation, reuse it for the same peer
+        with self._boxes_lock:
+            box = self._boxes.get(pub_key_hex)
+            if box is not None:
+                self._boxes.move_to_end(pub_key_hex)
+                return box
+
+        box = Box(self.key_pair, PublicKey(pub_key_hex, HexEncoder))
+        if self._box_cache_size > 0:
+            with self._boxes_lock:
+                self._boxes[pub_key_hex] = box
+                if len(self._boxes) > self._box_cache_size:
+                    self._boxes.popitem(last=False)
+        return box
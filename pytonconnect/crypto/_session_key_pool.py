@@ -0,0 +1,80 @@
+import queue
+import threading
+
+from ._session_crypto import SessionCrypto
+
+
+class SessionKeyPool:
+    """Session key pairs generated ahead of time in a background thread.
+
+    `acquire()` hands out a ready SessionCrypto, so connect link generation doesn't generate keys
+    on the request path. When the pool runs dry (a burst larger than `size`) keys are generated inline.
+    The thread is started by the first `acquire()`, call `start()` to fill the pool before a burst.
+    """
+
+    DEFAULT_SIZE = 1000
+    REFILL_TIMEOUT = 0.5  # how often the full pool checks if it was closed
+
+    _queue: queue.Queue
+    _thread: threading.Thread
+    _lock: threading.Lock
+    _closed: threading.Event
+    _misses: int
+
+    def __init__(self, size: int = DEFAULT_SIZE):
+        """
+        :param size: number of key pairs kept ready
+        """
+        self._queue = queue.Queue(size)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._misses = 0
+
+    @property
+    def available_count(self) -> int:
+        """Number of key pairs ready to be acquired."""
+        return self._queue.qsize()
+
+    @property
+    def misses_count(self) -> int:
+        """Number of key pairs generated inline because the pool was empty."""
+        return self._misses
+
+    def start(self):
+        """Start filling the pool in the background thread."""
+        with self._lock:
+            if self._thread is not None or self._closed.is_set():
+                return
+            self._thread = threading.Thread(target=self._refill, name='pytonconnect-session-keys', daemon=True)
+            self._thread.start()
+
+    def acquire(self) -> SessionCrypto:
+        """Return a new session key pair, every key pair is handed out once."""
+        self.start()
+        try:
+            return self._queue.get_nowait()
+        except queue.Empty:
+            self._misses += 1
+            return SessionCrypto()
+
+    def close(self):
+        """Stop the background thread, key pairs left in the pool are dropped."""
+        self._closed.set()
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
+        while not self._queue.empty():
+            self._queue.get_nowait()
+
+    def _refill(self):
+        session_crypto = None
+        while not self._closed.is_set():
+            if session_crypto is None:
+                session_crypto = SessionCrypto()
+            try:
+                self._queue.put(session_crypto, timeout=self.REFILL_TIMEOUT)
+                session_crypto = None
+            except queue.Full:
+                pass
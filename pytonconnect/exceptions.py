@@ -27,6 +27,14 @@ class FetchWalletsError(TonConnectError):
     info = 'An error occurred while fetching the wallets list.'
 
 
+class RequestTimeoutError(TonConnectError):
+    info = "Wallet didn't respond to the request in time."
+
+
+class EventsOverflowError(TonConnectError):
+    info = 'Events were received faster than they were read, the events stream is closed.'
+
+
 class UnknownError(TonConnectError):
     info = 'Unknown error.'
 
@@ -1,10 +1,14 @@
 from ._connect_event import (Account, ConnectEventParser, DeviceInfo, TonProof,
                              WalletInfo)
-from ._send_transaction import SendTransactionParser, TransactionMessage
+from ._send_transaction import (ChunkedTransactionResult,
+                                SendTransactionParser, TransactionChunkResult,
+                                TransactionMessage)
 
 __all__ = [
     'SendTransactionParser',
     'TransactionMessage',
+    'TransactionChunkResult',
+    'ChunkedTransactionResult',
     'ConnectEventParser',
     'WalletInfo',
     'DeviceInfo',
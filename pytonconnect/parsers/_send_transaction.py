@@ -1,11 +1,11 @@
 import json
 from dataclasses import dataclass
 from enum import IntEnum
-from typing import Optional
+from typing import List, Optional
 
-from pytonconnect.exceptions import (BadRequestError, TonConnectError,
-                                     UnknownAppError, UnknownError,
-                                     UserRejectsError)
+from pytonconnect.exceptions import (BadRequestError, RequestTimeoutError,
+                                     TonConnectError, UnknownAppError,
+                                     UnknownError, UserRejectsError)
 
 from ._rpc_parser import RpcParser
 
@@ -57,6 +57,55 @@ class TransactionMessage():
         )
 
 
+@dataclass
+class TransactionChunkResult():
+    index: int
+    messages: list
+    boc: Optional[str] = None
+    error: Optional[Exception] = None  # request of the chunk failed, e.g. UserRejectsError
+
+    @property
+    def sent(self) -> bool:
+        return self.boc is not None
+
+    @property
+    def skipped(self) -> bool:
+        """Chunk was not sent because an earlier chunk failed."""
+        return self.boc is None and self.error is None
+
+    @property
+    def timed_out(self) -> bool:
+        """The wallet didn't answer in time, it may still sign and send the chunk."""
+        return isinstance(self.error, RequestTimeoutError)
+
+
+@dataclass
+class ChunkedTransactionResult():
+    chunks: List[TransactionChunkResult]
+
+    @property
+    def ok(self) -> bool:
+        """All chunks are sent."""
+        return all(chunk.sent for chunk in self.chunks)
+
+    @property
+    def bocs(self) -> list:
+        """Bocs of the sent chunks in chunks order."""
+        return [chunk.boc for chunk in self.chunks if chunk.sent]
+
+    @property
+    def failed(self) -> List[TransactionChunkResult]:
+        """Chunks that were surely not sent (rejected, failed or skipped), their messages may be sent again."""
+        return [chunk for chunk in self.chunks if not chunk.sent and not chunk.timed_out]
+
+    @property
+    def unknown(self) -> List[TransactionChunkResult]:
+        """Chunks the wallet didn't answer in time. The wallet may still send them,
+        check the blockchain before sending their messages again.
+        """
+        return [chunk for chunk in self.chunks if chunk.timed_out]
+
+
 class SendTransactionParser(RpcParser):
 
     def convert_to_rpc_request(request: dict) -> dict:
@@ -1,7 +1,20 @@
 from ._bridge_gateway import BridgeGateway
+from ._bridge_multiplexer import BridgeMultiplexer
 from ._bridge_provider import BridgeProvider
+from ._bridge_selector import BridgeSelector
+from ._http_pool import HttpClientPool
+from ._reconnect import BridgeCircuitBreaker, ReconnectPolicy
+from ._request_timeouts import RequestTimeoutWheel
+from ._universal_link import UniversalLinkTemplate
 
 __all__ = [
     'BridgeProvider',
     'BridgeGateway',
+    'BridgeMultiplexer',
+    'HttpClientPool',
+    'RequestTimeoutWheel',
+    'ReconnectPolicy',
+    'BridgeCircuitBreaker',
+    'BridgeSelector',
+    'UniversalLinkTemplate',
 ]
@@ -1,13 +1,19 @@
 import asyncio
 import json
+from functools import partial
 
-from httpx import AsyncClient, ReadTimeout
+from httpx import ReadTimeout
 from httpx_sse import EventSource, ServerSentEvent, aconnect_sse
 
+from pytonconnect._background import run_in_background
 from pytonconnect.exceptions import TonConnectError
 from pytonconnect.logger import _LOGGER
 
+from ._bridge_multiplexer import BridgeMultiplexer
 from ._bridge_storage import BridgeGatewayStorage, BridgeProviderStorage
+from ._http_pool import HttpClientPool
+from ._message_pipeline import MessagePipeline
+from ._reconnect import BridgeCircuitBreaker, ReconnectPolicy
 
 
 class BridgeGateway:
@@ -19,6 +25,8 @@ class BridgeGateway:
     DEFAULT_TIMEOUT = 30  # default request timeout
 
     _handle_listen: asyncio.Task
+    _handle_reconnect: asyncio.Task
+    _reconnect_attempts: int
     _event_source: EventSource
     _is_closed: bool
 
@@ -27,7 +35,14 @@ class BridgeGateway:
     _session_id: str
     _listener: any
     _errors_listener: any
+    _decryptor: any
+    _pipeline: MessagePipeline
     _api_token: str
+    _http_pool: HttpClientPool
+    _multiplexer: BridgeMultiplexer
+    _reconnect_policy: ReconnectPolicy
+    _on_bridge_failure: any
+    _wallet_public_key: str
 
     def __init__(self,
                  storage: BridgeProviderStorage,
@@ -35,17 +50,44 @@ class BridgeGateway:
                  session_id: str,
                  listener,
                  errors_listener,
-                 api_tokens: dict[str, str] = None):
+                 api_tokens: dict[str, str] = None,
+                 http_pool: HttpClientPool = None,
+                 multiplexer: BridgeMultiplexer = None,
+                 decryptor=None,
+                 last_event_id_flush_events: int = BridgeGatewayStorage.DEFAULT_FLUSH_EVENTS,
+                 last_event_id_flush_interval: float = None,
+                 reconnect_policy: ReconnectPolicy = None,
+                 on_bridge_failure=None,
+                 wallet_public_key: str = None):
+        """
+        :param listener: async callable receiving the bridge message, or `(bridge message, decryptor result)`
+            if `decryptor` is set
+        :param decryptor: callable decrypting the bridge message, it is run as a separate pipeline stage
+            (in a worker thread for multiplexed streams with an executor), so it must be thread-safe
+        :param last_event_id_flush_events: write the last event id every this number of events
+        :param last_event_id_flush_interval: write the last event id this time in seconds after an event,
+            it is always written on pause and close, see BridgeGatewayStorage
+        :param reconnect_policy: delays of reconnects after the stream breaks, process-wide policy by default.
+            Not used with the multiplexer, its streams follow the policy of the multiplexer
+        :param on_bridge_failure: async callable called before a reconnect when the circuit breaker
+            of the bridge is open, it returns True if the session was moved to another bridge (failover)
+        :param wallet_public_key: key of the connected wallet, lets the multiplexer route its messages at once
+        """
 
         self._handle_listen = None
+        self._handle_reconnect = None
+        self._reconnect_attempts = 0
         self._event_source = None
         self._is_closed = False
 
-        self._storage = BridgeGatewayStorage(storage, bridge_url)
+        self._storage = BridgeGatewayStorage(storage, bridge_url, last_event_id_flush_events,
+                                             last_event_id_flush_interval)
         self._bridge_url = bridge_url
         self._session_id = session_id
         self._listener = listener
         self._errors_listener = errors_listener
+        self._decryptor = decryptor
+        self._pipeline = MessagePipeline(name=session_id)
 
         self._api_token = None
         for api_name, api_token in (api_tokens or {}).items():
@@ -53,6 +95,12 @@ class BridgeGateway:
                 self._api_token = api_token
                 break
 
+        self._http_pool = http_pool or HttpClientPool.default()
+        self._multiplexer = multiplexer
+        self._reconnect_policy = reconnect_policy or ReconnectPolicy.default()
+        self._on_bridge_failure = on_bridge_failure
+        self._wallet_public_key = wallet_public_key
+
     async def listen_event_source(self,
                                   resolve: asyncio.Future,
                                   url: str,
@@ -62,41 +110,82 @@ class BridgeGateway:
         if self._api_token is not None:
             headers['Authorization'] = f'Bearer {self._api_token}'
 
+        breaker = self._reconnect_policy.get_breaker(self._bridge_url)
         try:
-            async with AsyncClient() as client:
-                async with aconnect_sse(client, "GET", url, headers=headers, timeout=timeout) as self._event_source:
-                    resolve.set_result(True)
-                    try:
-                        async for event in self._event_source.aiter_sse():
-                            await self._messages_handler(event)
-                    except ReadTimeout:
-                        asyncio.create_task(self.register_session(bridge_url=url))
+            client = self._http_pool.get_client(url)
+            async with aconnect_sse(client, "GET", url, headers=headers, timeout=timeout) as self._event_source:
+                self._event_source.response.raise_for_status()
+                breaker.record_success()
+                self._reconnect_attempts = 0
+                resolve.set_result(True)
+                try:
+                    async for event in self._event_source.aiter_sse():
+                        await self._messages_handler(event)
+                except ReadTimeout:
+                    # idle stream, reopen it at once
+                    run_in_background(self.register_session(), f'Bridge {self._bridge_url} resubscription')
+                    return
+            # the bridge closed the stream
+            self._schedule_reconnect()
 
         except asyncio.exceptions.CancelledError:
             pass
 
         except Exception as e:
-            _LOGGER.exception(f'Bridge exception (restart) -> {type(e)}')
-            asyncio.create_task(self.register_session())
+            _LOGGER.warning(f'Bridge {self._bridge_url} exception (reconnect) -> {type(e)}: {e}')
+            breaker.record_failure()
+            self._schedule_reconnect()
 
         finally:
             if not resolve.done():
                 resolve.set_result(False)
 
+    @property
+    def breaker(self) -> BridgeCircuitBreaker:
+        """Circuit breaker of the bridge of the session."""
+        policy = self._multiplexer._reconnect_policy if self._multiplexer is not None else self._reconnect_policy
+        return policy.get_breaker(self._bridge_url)
+
+    @property
+    def reconnect_attempts(self) -> int:
+        """Number of failed reconnects in a row, 0 when the stream is healthy."""
+        return self._reconnect_attempts
+
+    @property
+    def is_listening(self):
+        """Shows if the bridge stream of the session is opened (or opening)."""
+        if self._multiplexer is not None:
+            return self._multiplexer.is_subscribed(self)
+        if self._handle_reconnect is not None and not self._handle_reconnect.done():
+            return True
+        return self._handle_listen is not None and not self._handle_listen.done()
+
+    async def ensure_listening(self) -> bool:
+        """Open the bridge stream if it is not opened yet, resuming from the stored last event id."""
+        if self.is_listening:
+            return True
+        return await self.register_session()
+
     async def register_session(self, timeout=DEFAULT_TIMEOUT, bridge_url=None) -> bool:
         if self._is_closed:
             return False
 
+        if self._multiplexer is not None:
+            return await self._multiplexer.subscribe(self)
+
         if bridge_url is None:
             bridge_base = self._bridge_url.rstrip('/')
             bridge_url = f'{bridge_base}/{self.SSE_PATH}?client_id={self._session_id}'
 
+            # the new stream resumes after the last dispatched message
+            self._pipeline.clear()
             last_event_id = await self._storage.getLastEventId()
             if last_event_id:
                 bridge_url += f'&last_event_id={last_event_id}'
 
         if self._handle_listen and not self._handle_listen.done():
             self._handle_listen.cancel()
+        self._cancel_reconnect()
 
         loop = asyncio.get_running_loop()
         resolve = loop.create_future()
@@ -117,31 +206,110 @@ class BridgeGateway:
         if self._api_token is not None:
             headers['Authorization'] = f'Bearer {self._api_token}'
 
-        async with AsyncClient() as client:
-            await client.post(bridge_url, data=request, headers=headers)
+        client = self._http_pool.get_client(bridge_url)
+        await client.post(bridge_url, content=request, headers=headers)
 
     def pause(self):
+        if self._multiplexer is not None:
+            self._multiplexer.unsubscribe(self)
+
         if self._handle_listen and not self._handle_listen.done():
             self._handle_listen.cancel()
             self._handle_listen = None
+        self._cancel_reconnect()
+        # not dispatched messages are received again on resume, the last event id is stored on dispatch
+        self._pipeline.clear()
+
+        if self._is_closed:
+            # the session is dropped or replaced, its last event id must not overwrite the new one
+            self._storage.discard()
+            return
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return  # no event loop, nothing was received
+        run_in_background(self._storage.flush(), 'Last event id flush')
 
     async def unpause(self):
         await self.register_session()
 
+    async def flush(self):
+        """Write the last event id of the stream to the storage."""
+        await self._storage.flush()
+
     def close(self):
         self._is_closed = True
         self.pause()
 
+    def _schedule_reconnect(self):
+        if self._is_closed:
+            return
+        self._cancel_reconnect()
+        self._reconnect_attempts += 1
+        self._handle_reconnect = asyncio.create_task(self._reconnect(self._reconnect_attempts))
+
+    def _cancel_reconnect(self):
+        if self._handle_reconnect is not None and not self._handle_reconnect.done() \
+                and self._handle_reconnect is not asyncio.current_task():
+            self._handle_reconnect.cancel()
+        self._handle_reconnect = None
+
+    async def _reconnect(self, attempt: int):
+        delay = self._reconnect_policy.get_delay(attempt)
+        if delay is None:
+            # stays closed until the next request or unpause
+            _LOGGER.error(f'Bridge {self._bridge_url} reconnect attempts exhausted for session {self._session_id}')
+            self._reconnect_attempts = 0
+            return
+
+        await asyncio.sleep(delay)
+        breaker = self._reconnect_policy.get_breaker(self._bridge_url)
+        if breaker.state != BridgeCircuitBreaker.CLOSED and self._on_bridge_failure is not None:
+            if await self._on_bridge_failure():
+                return
+        await breaker.wait()
+        await self.register_session()
+
     async def _messages_handler(self, event: ServerSentEvent):
         if event.event == self.HEARTBEAT_MSG or event.data == '':
             return
 
-        await self._storage.setLastEventId(event.id)
+        await self._pipeline.put(partial(self._prepare_message, event.data),
+                                 partial(self._dispatch_message, event.id))
+
+    def _prepare_message(self, data: str) -> tuple:
+        # parse and decrypt stages, errors are raised on dispatch after the event id is stored
+        try:
+            bridge_incoming_message = json.loads(data)
+        except Exception:
+            return None, None, TonConnectError(f'Bridge message parse failed, message {data}')
+
+        if self._decryptor is None:
+            return bridge_incoming_message, None, None
+        try:
+            return bridge_incoming_message, self._decryptor(bridge_incoming_message), None
+        except Exception as e:
+            return bridge_incoming_message, None, e
+
+    async def _dispatch_message(self, event_id: str, prepared: tuple):
+        await self._storage.setLastEventId(event_id)
+
+        bridge_incoming_message, decrypted, error = prepared
+        if error is not None:
+            raise error
+        if not self._is_closed:
+            await self._call_listener(bridge_incoming_message, decrypted)
+
+    async def _call_listener(self, bridge_incoming_message: dict, decrypted=None):
+        if self._decryptor is None:
+            await self._listener(bridge_incoming_message)
+        else:
+            await self._listener(bridge_incoming_message, decrypted)
 
+    async def _handle_message(self, event_id: str, bridge_incoming_message: dict, decrypted=None):
+        """Handle a message demultiplexed from a shared stream by BridgeMultiplexer."""
         if not self._is_closed:
-            try:
-                bridge_incoming_message = json.loads(event.data)
-            except Exception:
-                raise TonConnectError(f'Bridge message parse failed, message {event.data}')
-            else:
-                await self._listener(bridge_incoming_message)
+            if self._decryptor is not None and decrypted is None:
+                decrypted = self._decryptor(bridge_incoming_message)
+            await self._call_listener(bridge_incoming_message, decrypted)
+            await self._storage.setLastEventId(event_id)
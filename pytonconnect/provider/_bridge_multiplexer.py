@@ -0,0 +1,452 @@
+import asyncio
+import json
+import math
+from concurrent.futures import Executor
+from functools import partial
+
+from httpx import ReadTimeout
+from httpx_sse import ServerSentEvent, aconnect_sse
+from nacl.exceptions import CryptoError
+
+from pytonconnect._background import run_in_background
+from pytonconnect.logger import _LOGGER
+
+from ._http_pool import HttpClientPool
+from ._message_pipeline import MessagePipeline
+from ._reconnect import BridgeCircuitBreaker, ReconnectPolicy
+
+
+def _min_event_id(event_ids):
+    numeric = [int(event_id) for event_id in event_ids if str(event_id).isdigit()]
+    if numeric and len(numeric) == len(event_ids):
+        return str(min(numeric))
+    return min(event_ids) if event_ids else None
+
+
+def _is_newer_event_id(event_id, last_event_id) -> bool:
+    # only numeric ids are ordered, other ids are never considered replayed
+    if not last_event_id or not str(event_id).isdigit() or not str(last_event_id).isdigit():
+        return True
+    return int(event_id) > int(last_event_id)
+
+
+class _MultiplexedStream:
+
+    _multiplexer: 'BridgeMultiplexer'
+    _bridge_url: str
+    _api_token: str
+    _task: asyncio.Task
+    _restart_handle: asyncio.TimerHandle
+    _waiters: list
+    _last_event_id: str
+    _dispatched_event_id: str
+    _member_last_ids: dict
+    _handled_ids: dict
+    _covered: set
+    _routes: dict
+    _pipeline: MessagePipeline
+    _reconnect_attempts: int
+
+    gateways: dict
+
+    def __init__(self, multiplexer: 'BridgeMultiplexer', bridge_url: str, api_token: str = None):
+        self._multiplexer = multiplexer
+        self._bridge_url = bridge_url
+        self._api_token = api_token
+        self._task = None
+        self._restart_handle = None
+        self._waiters = []
+        self._last_event_id = None  # last received event, the stream is resubscribed after it
+        self._dispatched_event_id = None
+        self._member_last_ids = {}  # session_id -> last event id known for the session
+        # session_id -> last event id handled by the session, a stream resumed for another member replays older ones
+        self._handled_ids = {}
+        self._covered = set()  # sessions which were subscribed on the currently opened stream
+        self._routes = {}  # wallet public key -> session_id
+        self._reconnect_attempts = 0
+        # kept across resubscriptions, messages received on the previous stream are still dispatched
+        self._pipeline = MessagePipeline(multiplexer._pipeline_maxsize, multiplexer._decrypt_executor, bridge_url)
+
+        self.gateways = {}
+
+    @property
+    def is_open(self):
+        return self._task is not None and not self._task.done() and bool(self._covered)
+
+    async def add(self, gateway) -> bool:
+        session_id = gateway._session_id
+        self.gateways[session_id] = gateway
+        self._member_last_ids[session_id] = await gateway._storage.getLastEventId()
+        if _is_newer_event_id(self._member_last_ids[session_id], self._handled_ids.get(session_id)):
+            self._handled_ids[session_id] = self._member_last_ids[session_id]
+        if gateway._wallet_public_key:
+            # messages of a connected wallet are routed without trying to decrypt them by every session
+            self._routes[gateway._wallet_public_key] = session_id
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.schedule_restart()
+        return await waiter
+
+    def remove(self, session_id: str):
+        self.gateways.pop(session_id, None)
+        self._member_last_ids.pop(session_id, None)
+        self._handled_ids.pop(session_id, None)
+        self._covered.discard(session_id)
+        for wallet_public_key in [k for k, v in self._routes.items() if v == session_id]:
+            del self._routes[wallet_public_key]
+
+        if self.gateways:
+            self.schedule_restart()
+        else:
+            self.close()
+
+    def schedule_restart(self, delay: float = None):
+        if self._restart_handle is not None:
+            return
+        delay = self._multiplexer.RESUBSCRIBE_DELAY if delay is None else delay
+        self._restart_handle = asyncio.get_running_loop().call_later(delay, self._restart)
+
+    def close(self):
+        if self._restart_handle is not None:
+            self._restart_handle.cancel()
+            self._restart_handle = None
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        self._task = None
+        self._pipeline.clear()
+        self._resolve_waiters(self._waiters, False)
+        self._waiters = []
+
+    def _restart(self):
+        self._restart_handle = None
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+        if not self.gateways:
+            self.close()
+            return
+
+        # sessions that were listening on the previous stream have seen everything up to its last event
+        if self._last_event_id is not None:
+            for session_id in self._covered:
+                if session_id in self._member_last_ids:
+                    self._member_last_ids[session_id] = self._last_event_id
+
+        waiters, self._waiters = self._waiters, []
+        self._task = asyncio.create_task(self._listen(list(self.gateways), waiters))
+
+    def _get_url(self, session_ids: list) -> str:
+        url = f'{self._bridge_url}/{self._multiplexer.SSE_PATH}?client_id={",".join(session_ids)}'
+
+        # resume from the oldest event any member may have missed, duplicates are filtered by providers
+        last_event_ids = [self._member_last_ids[session_id] for session_id in session_ids
+                          if self._member_last_ids.get(session_id)]
+        last_event_id = _min_event_id(last_event_ids)
+        if last_event_id:
+            url += f'&last_event_id={last_event_id}'
+        return url
+
+    def _get_headers(self) -> dict:
+        headers = {}
+        if self._api_token is not None:
+            headers['Authorization'] = f'Bearer {self._api_token}'
+        return headers
+
+    async def _listen(self, session_ids: list, waiters: list):
+        url = self._get_url(session_ids)
+        breaker = self._multiplexer._reconnect_policy.get_breaker(self._bridge_url)
+        reconnect = False
+
+        try:
+            if self._reconnect_attempts:
+                await breaker.wait()
+            client = self._multiplexer._http_pool.get_client(url)
+            async with aconnect_sse(client, 'GET', url, headers=self._get_headers(),
+                                    timeout=self._multiplexer._timeout) as event_source:
+                event_source.response.raise_for_status()
+                breaker.record_success()
+                self._reconnect_attempts = 0
+                self._covered = set(session_ids)
+                self._resolve_waiters(waiters, True)
+                try:
+                    async for event in event_source.aiter_sse():
+                        await self._messages_handler(event)
+                except ReadTimeout:
+                    # idle stream, reopen it at once
+                    self._task = None
+                    self.schedule_restart(0)
+                    return
+            reconnect = True  # the bridge closed the stream
+
+        except asyncio.CancelledError:
+            # waiters were not answered yet, pass them to the next stream
+            self._waiters.extend(waiter for waiter in waiters if not waiter.done())
+            waiters = []
+            raise
+
+        except Exception as e:
+            _LOGGER.warning(f'Bridge {self._bridge_url} multiplexed stream exception (reconnect) -> {type(e)}: {e}')
+            breaker.record_failure()
+            reconnect = True
+
+        finally:
+            self._resolve_waiters(waiters, False)
+
+        if reconnect and breaker.state != BridgeCircuitBreaker.CLOSED:
+            # sessions of wallets with other bridges leave the broken one
+            for gateway in list(self.gateways.values()):
+                if gateway._on_bridge_failure is not None:
+                    run_in_background(gateway._on_bridge_failure(), f'Session {gateway._session_id} failover')
+
+        if reconnect and self.gateways:
+            self._task = None
+            self._reconnect_attempts += 1
+            delay = self._multiplexer._reconnect_policy.get_delay(self._reconnect_attempts)
+            if delay is not None:
+                self.schedule_restart(delay)
+            else:
+                # sessions are subscribed again by their next request or unpause
+                _LOGGER.error(f'Bridge {self._bridge_url} reconnect attempts exhausted, '
+                              f'{len(self.gateways)} sessions are unsubscribed')
+                self._reconnect_attempts = 0
+                for gateway in list(self.gateways.values()):
+                    self._multiplexer.unsubscribe(gateway)
+
+    async def _messages_handler(self, event: ServerSentEvent):
+        if event.event == self._multiplexer.HEARTBEAT_MSG or event.data == '':
+            return
+
+        self._last_event_id = event.id
+
+        try:
+            bridge_incoming_message = json.loads(event.data)
+        except Exception:
+            _LOGGER.error(f'Bridge message parse failed, message {event.data}')
+            return
+
+        session_id = bridge_incoming_message.get('to') \
+            or self._routes.get(bridge_incoming_message.get('from'))
+        if session_id in self.gateways:
+            candidates = [self.gateways[session_id]]
+        else:
+            # unknown sender (e.g. connect event for a new session): find the session able to decrypt it
+            bound_sessions = set(self._routes.values())
+            candidates = [gateway for session_id, gateway in self.gateways.items() if session_id not in bound_sessions]
+        candidates = [gateway for gateway in candidates
+                      if _is_newer_event_id(event.id, self._handled_ids.get(gateway._session_id))]
+        if not candidates:
+            return
+
+        await self._pipeline.put(partial(self._decrypt, candidates, bridge_incoming_message),
+                                 partial(self._dispatch, candidates, event.id, bridge_incoming_message))
+
+    def _decrypt(self, candidates: list, bridge_incoming_message: dict) -> tuple:
+        # decrypt stage, runs in the executor of the multiplexer if it is set
+        for gateway in candidates:
+            if gateway._decryptor is None:
+                continue
+            try:
+                return gateway, gateway._decryptor(bridge_incoming_message)
+            except CryptoError:
+                continue
+        return None, None
+
+    async def _dispatch(self, candidates: list, event_id: str, bridge_incoming_message: dict, decrypted: tuple):
+        self._dispatched_event_id = event_id
+        gateway, wallet_message = decrypted
+        if gateway is not None:
+            await self._handle(gateway, event_id, bridge_incoming_message, wallet_message)
+            return
+
+        # gateways without a decryptor decrypt in their listener
+        for gateway in candidates:
+            if gateway._decryptor is not None:
+                continue
+            try:
+                await self._handle(gateway, event_id, bridge_incoming_message)
+            except CryptoError:
+                continue
+            return
+
+        _LOGGER.debug(f'Bridge message from {bridge_incoming_message.get("from")} matches no session')
+
+    async def _handle(self, gateway, event_id: str, bridge_incoming_message: dict, wallet_message=None):
+        session_id = gateway._session_id
+        if self.gateways.get(session_id) is not gateway:
+            return  # unsubscribed while the message was waiting in the pipeline
+        if not _is_newer_event_id(event_id, self._handled_ids.get(session_id)):
+            return  # replayed for another member of the stream
+        self._handled_ids[session_id] = event_id
+
+        sender = bridge_incoming_message.get('from')
+        if not bridge_incoming_message.get('to') and sender and self._routes.get(sender) != session_id:
+            self._routes[sender] = session_id
+
+        # one broken message must not restart the stream shared by other sessions
+        try:
+            await gateway._handle_message(event_id, bridge_incoming_message, wallet_message)
+        except CryptoError:
+            if gateway._decryptor is not None:
+                _LOGGER.exception(f'Bridge message handling failed for session {session_id}')
+            else:
+                self._routes.pop(sender, None)
+                raise
+        except Exception:
+            _LOGGER.exception(f'Bridge message handling failed for session {session_id}')
+
+    def _resolve_waiters(self, waiters: list, result: bool):
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(result)
+
+
+class BridgeMultiplexer:
+    """Subscribes many bridge sessions over a small number of SSE streams per bridge url.
+
+    Incoming messages are demultiplexed to the gateway of the receiving session, streams are
+    resubscribed (and merged when possible) as sessions join and leave.
+    Sessions share a stream only if they have the same bridge url and API token.
+    Every stream processes its messages in a bounded pipeline, messages can be decrypted in `decrypt_executor`
+    (e.g. a ThreadPoolExecutor) while the order of the messages is kept.
+    """
+
+    SSE_PATH = 'events'
+    HEARTBEAT_MSG = 'heartbeat'
+    DEFAULT_MAX_SESSIONS_PER_STREAM = 100  # keeps the stream url within common server limits
+    DEFAULT_TIMEOUT = 30
+    RESUBSCRIBE_DELAY = 0.05  # coalesce joins and leaves before resubscribing a stream
+
+    _max_sessions_per_stream: int
+    _timeout: float
+    _http_pool: HttpClientPool
+    _pipeline_maxsize: int
+    _decrypt_executor: Executor
+    _reconnect_policy: ReconnectPolicy
+    _streams: dict[tuple, list[_MultiplexedStream]]
+    _subscriptions: dict[tuple, _MultiplexedStream]
+
+    def __init__(self,
+                 max_sessions_per_stream: int = DEFAULT_MAX_SESSIONS_PER_STREAM,
+                 http_pool: HttpClientPool = None,
+                 timeout: float = DEFAULT_TIMEOUT,
+                 pipeline_maxsize: int = MessagePipeline.DEFAULT_MAXSIZE,
+                 decrypt_executor: Executor = None,
+                 reconnect_policy: ReconnectPolicy = None):
+        """
+        :param max_sessions_per_stream: maximum number of session ids listened on one SSE stream
+        :param http_pool: pool of HTTP clients for the streams, process-wide pool by default
+        :param timeout: SSE stream request timeout
+        :param pipeline_maxsize: maximum number of received messages waiting for the dispatch per stream,
+            reading the stream waits when it is reached
+        :param decrypt_executor: executor to decrypt messages in, the event loop thread if None
+        :param reconnect_policy: delays of reconnects after a stream breaks, process-wide policy by default
+        """
+        self._max_sessions_per_stream = max_sessions_per_stream
+        self._timeout = timeout
+        self._http_pool = http_pool or HttpClientPool.default()
+        self._pipeline_maxsize = pipeline_maxsize
+        self._decrypt_executor = decrypt_executor
+        self._reconnect_policy = reconnect_policy or ReconnectPolicy.default()
+        self._streams = {}
+        self._subscriptions = {}
+
+    @property
+    def streams_count(self) -> int:
+        """Number of SSE streams currently held by the multiplexer."""
+        return sum(len(streams) for streams in self._streams.values())
+
+    @property
+    def sessions_count(self) -> int:
+        """Number of sessions currently subscribed."""
+        return len(self._subscriptions)
+
+    async def subscribe(self, gateway) -> bool:
+        """Start listening for the gateway session.
+
+        :param gateway: BridgeGateway of the session
+        :return: True if the stream with the session is opened
+        """
+        bridge_url = gateway._bridge_url.rstrip('/')
+        key = (bridge_url, gateway._session_id)
+
+        stream = self._subscriptions.get(key)
+        if stream is not None:
+            stream.gateways[gateway._session_id] = gateway
+            if stream.is_open and gateway._session_id in stream._covered:
+                return True
+        else:
+            # the stream is opened with one API token, sessions with other tokens get their own streams
+            streams = self._streams.setdefault((bridge_url, gateway._api_token), [])
+            stream = next((s for s in streams if len(s.gateways) < self._max_sessions_per_stream), None)
+            if stream is None:
+                stream = _MultiplexedStream(self, bridge_url, gateway._api_token)
+                streams.append(stream)
+            self._subscriptions[key] = stream
+
+        return await stream.add(gateway)
+
+    def is_subscribed(self, gateway) -> bool:
+        """Shows if the gateway session is listened (or waits for its stream to open)."""
+        stream = self._subscriptions.get((gateway._bridge_url.rstrip('/'), gateway._session_id))
+        return stream is not None and stream.gateways.get(gateway._session_id) is gateway
+
+    def unsubscribe(self, gateway):
+        """Stop listening for the gateway session."""
+        bridge_url = gateway._bridge_url.rstrip('/')
+        stream = self._subscriptions.get((bridge_url, gateway._session_id))
+        if stream is None or stream.gateways.get(gateway._session_id) is not gateway:
+            return
+
+        del self._subscriptions[(bridge_url, gateway._session_id)]
+        stream.remove(gateway._session_id)
+        self._rebalance((bridge_url, stream._api_token))
+
+    def close(self):
+        """Close all streams."""
+        for streams in self._streams.values():
+            for stream in streams:
+                stream.close()
+        self._streams = {}
+        self._subscriptions = {}
+
+    def _rebalance(self, streams_key: tuple):
+        bridge_url, _ = streams_key
+        streams = [stream for stream in self._streams.get(streams_key, []) if stream.gateways]
+        if not streams:
+            self._streams.pop(streams_key, None)
+            return
+        self._streams[streams_key] = streams
+
+        sessions_count = sum(len(stream.gateways) for stream in streams)
+        if len(streams) <= math.ceil(sessions_count / self._max_sessions_per_stream):
+            return
+
+        # move sessions of the emptiest stream to the streams with free slots
+        streams.sort(key=lambda stream: len(stream.gateways))
+        source, targets = streams[0], streams[1:]
+        for target in targets:
+            free = self._max_sessions_per_stream - len(target.gateways)
+            moved = list(source.gateways.items())[:free]
+            for session_id, gateway in moved:
+                source.gateways.pop(session_id)
+                target.gateways[session_id] = gateway
+                last_event_id = source._member_last_ids.pop(session_id, None)
+                target._handled_ids[session_id] = source._handled_ids.pop(session_id, None)
+                # messages of the source stream waiting in its pipeline are dropped, receive them again
+                if session_id in source._covered and source._dispatched_event_id is not None:
+                    last_event_id = source._dispatched_event_id
+                target._member_last_ids[session_id] = last_event_id
+                for wallet_public_key in [k for k, v in source._routes.items() if v == session_id]:
+                    target._routes[wallet_public_key] = source._routes.pop(wallet_public_key)
+                self._subscriptions[(bridge_url, session_id)] = target
+            if moved:
+                target.schedule_restart()
+            if not source.gateways:
+                break
+
+        if not source.gateways:
+            target._waiters.extend(source._waiters)
+            source._waiters = []
+            source.close()
+            streams.remove(source)
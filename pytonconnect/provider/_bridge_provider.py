@@ -1,63 +1,174 @@
 import asyncio
 import json
-from urllib.parse import quote_plus
+from functools import partial
 
-from pytonconnect.crypto import SessionCrypto
+from pytonconnect.crypto import SessionCrypto, SessionKeyPool
+from pytonconnect._background import run_in_background
 from pytonconnect.exceptions import TonConnectError
 from pytonconnect.logger import _LOGGER
 from pytonconnect.storage import IStorage
 
 from ._bridge_gateway import BridgeGateway
+from ._bridge_multiplexer import BridgeMultiplexer
+from ._bridge_selector import BridgeSelector
 from ._bridge_session import BridgeSession
-from ._bridge_storage import BridgeProviderStorage
+from ._bridge_storage import (BridgeGatewayStorage, BridgeProviderStorage,
+                              RpcRequestIdAllocator)
+from ._http_pool import HttpClientPool
 from ._provider import BaseProvider
+from ._reconnect import BridgeCircuitBreaker, ReconnectPolicy
+from ._request_timeouts import RequestTimeoutWheel
+from ._universal_link import UniversalLinkTemplate
 
 
 class BridgeProvider(BaseProvider):
 
     DISCONNECT_TIMEOUT = 600
-    STANDART_UNIVERSAL_URL = 'tc://'
+    DEFAULT_REQUEST_TIMEOUT = 600
+    STANDART_UNIVERSAL_URL = UniversalLinkTemplate.STANDART_UNIVERSAL_URL
 
     _wallet: dict
 
     _storage: BridgeProviderStorage
     _session: BridgeSession
     _gateway: BridgeGateway
+    _pending_gateways: dict[str, BridgeGateway]
+    _wallet_bridges: list
     _pending_requests: dict[int, asyncio.Future]
     _listeners: list
     _api_tokens: dict[str, str]
-
-    def __init__(self, storage: IStorage, wallet: dict = None, api_tokens: dict[str, str] = None):
+    _http_pool: HttpClientPool
+    _multiplexer: BridgeMultiplexer
+    _request_timeout: float
+    _timeout_wheel: RequestTimeoutWheel
+    _gateway_options: dict
+    _bridge_selector: BridgeSelector
+    _session_key_pool: SessionKeyPool
+
+    def __init__(self,
+                 storage: IStorage,
+                 wallet: dict = None,
+                 api_tokens: dict[str, str] = None,
+                 http_pool: HttpClientPool = None,
+                 multiplexer: BridgeMultiplexer = None,
+                 storage_flush_policy: str = BridgeProviderStorage.FLUSH_IMMEDIATE,
+                 storage_flush_delay: float = BridgeProviderStorage.DEFAULT_FLUSH_DELAY,
+                 rpc_request_id_block_size: int = RpcRequestIdAllocator.DEFAULT_BLOCK_SIZE,
+                 request_timeout: float = DEFAULT_REQUEST_TIMEOUT,
+                 timeout_wheel: RequestTimeoutWheel = None,
+                 last_event_id_flush_events: int = BridgeGatewayStorage.DEFAULT_FLUSH_EVENTS,
+                 last_event_id_flush_interval: float = None,
+                 reconnect_policy: ReconnectPolicy = None,
+                 bridge_selector: BridgeSelector = None,
+                 session_key_pool: SessionKeyPool = None):
         self._wallet = wallet
 
-        self._storage = BridgeProviderStorage(storage)
+        self._storage = BridgeProviderStorage(storage, storage_flush_policy, storage_flush_delay,
+                                              rpc_request_id_block_size)
         self._session = BridgeSession()
         self._gateway = None
+        self._pending_gateways = {}  # bridge url -> gateway of a multi-wallet connect until a wallet answers
+        self._wallet_bridges = []  # (wallet, bridge url) of the multi-wallet connect
         self._pending_requests = {}
         self._listeners = []
         self._api_tokens = api_tokens or {}
+        self._http_pool = http_pool
+        self._multiplexer = multiplexer
+        self._request_timeout = request_timeout
+        self._timeout_wheel = timeout_wheel or RequestTimeoutWheel.default()
+        self._gateway_options = {
+            'last_event_id_flush_events': last_event_id_flush_events,
+            'last_event_id_flush_interval': last_event_id_flush_interval,
+            'reconnect_policy': reconnect_policy,
+        }
+        self._bridge_selector = bridge_selector or BridgeSelector.default()
+        self._session_key_pool = session_key_pool
+
+    @property
+    def pending_requests_count(self) -> int:
+        """Number of requests waiting for the wallet response."""
+        return len(self._pending_requests)
+
+    @property
+    def is_connecting(self) -> bool:
+        """Shows if a connect was started and no wallet has answered yet."""
+        if self._pending_gateways:
+            return True
+        return self._gateway is not None and self._session.session_crypto is not None \
+            and not self._session.wallet_public_key
 
     async def connect(self, request: dict):
+        return await self.connect_with_template(UniversalLinkTemplate.for_wallet(self._wallet, request))
+
+    async def connect_with_template(self, link_template: UniversalLinkTemplate, auto_listen=True) -> str:
+        """Start a connect with the request encoded in the link template, see `connect`.
+
+        :param link_template: universal link template of the wallet and the connect request
+        :param auto_listen: listen for the wallet answer at once. If False the pending connect is only stored,
+            `restore_pending_connection()` starts listening later
+        :return: universal link
+        """
         self._close_gateways()
-        session_crypto = SessionCrypto()
+        session_crypto = self._create_session_crypto()
 
-        bridge_url = self._wallet['bridge_url'] if 'bridge_url' in self._wallet else ''
+        bridge_urls = self._get_wallet_bridge_urls(self._wallet)
+        # the link is returned at once, a bridge not measured yet is probed in background
+        bridge_url = await self._select_bridge(bridge_urls, wait=False) or ''
 
         self._session.session_crypto = session_crypto
         self._session.bridge_url = bridge_url
+        self._session.bridge_urls = bridge_urls
 
         await self._storage.setConnection({
             'session': self._session.get_dict(),
             'connection_source': self._wallet,
         })
 
-        await self._open_gateways()
+        if auto_listen:
+            await self._open_gateways()
+
+        return link_template.format(session_crypto.session_id)
+
+    async def connect_many(self, wallets: list, request: dict) -> list:
+        """Generate universal links of several wallets for one session and listen for the first wallet to connect.
 
-        universal_url = self._wallet['universal_url'] \
-            if 'universal_url' in self._wallet \
-            else BridgeProvider.STANDART_UNIVERSAL_URL
+        All links share the session keys, each distinct bridge is listened once. When a wallet sends
+        the connect event its bridge is kept and the streams of the other bridges are closed.
 
-        return self._generate_universal_url(universal_url, request)
+        :param wallets: wallets with bridge urls and universal links
+        :param request: connect request
+        :return: universal links in the order of `wallets`, None for wallets without an SSE bridge
+        """
+        self._close_gateways()
+        self._wallet = {}
+        self._wallet_bridges = []
+        self._session.session_crypto = self._create_session_crypto()
+        self._session.bridge_url = None
+
+        for wallet in wallets:
+            bridge_urls = self._get_wallet_bridge_urls(wallet)
+            if not bridge_urls:
+                continue  # the wallet can't answer over a bridge
+            # wallets sharing a bridge are listened on one stream
+            listened = [url for url in bridge_urls if url in self._pending_gateways]
+            self._add_pending_gateway(wallet, listened[0] if listened else await self._select_bridge(
+                bridge_urls, wait=False))
+        if not self._wallet_bridges:
+            raise TonConnectError('None of the wallets has an SSE bridge.')
+
+        # the listened bridges are stored, so the pending connect is restored on the same streams
+        self._session.bridge_urls = list(self._pending_gateways)
+        await self._storage.setConnection({
+            'session': self._session.get_dict(),
+            'connection_source': [wallet for wallet, _ in self._wallet_bridges],
+        })
+
+        await asyncio.gather(*[gateway.register_session() for gateway in self._pending_gateways.values()])
+
+        session_id = self._session.session_crypto.session_id
+        bridged = {id(wallet) for wallet, _ in self._wallet_bridges}
+        return [UniversalLinkTemplate.for_wallet(wallet, request).format(session_id) if id(wallet) in bridged else None
+                for wallet in wallets]
 
     async def restore_connection(self, auto_listen=True):
         self._close_gateways()
@@ -78,8 +189,44 @@ class BridgeProvider(BaseProvider):
 
         return True
 
+    async def has_stored_connection(self) -> bool:
+        """Shows if the storage keeps a connected session, a pending connect doesn't count."""
+        connection = await self._storage.getConnection()
+        return 'connect_event' in connection
+
+    async def restore_pending_connection(self, auto_listen=True) -> bool:
+        """Listen again for the wallet answer to a stored connect of one wallet or of several wallets
+        from `connect_many` (e.g. after a restart or a connect started with `auto_listen=False`).
+
+        :return: True if a pending connect is found
+        """
+        self._close_gateways()
+
+        connection = await self._storage.getConnection()
+        connection_source = connection.get('connection_source')
+        if not isinstance(connection_source, (dict, list)) or 'session' not in connection:
+            return False
+        self._session = BridgeSession(connection['session'])
+
+        if isinstance(connection_source, dict):
+            self._wallet = connection_source
+            await self._open_gateways(auto_listen)
+            return True
+
+        self._wallet = {}
+        self._wallet_bridges = []
+        for wallet in connection_source:
+            bridge_urls = self._get_wallet_bridge_urls(wallet)
+            listened = [url for url in bridge_urls if url in self._session.bridge_urls]
+            if bridge_urls:
+                self._add_pending_gateway(wallet, (listened or bridge_urls)[0])
+        if auto_listen:
+            await asyncio.gather(*[gateway.register_session() for gateway in self._pending_gateways.values()])
+        return bool(self._wallet_bridges)
+
     def close_connection(self):
         self._close_gateways()
+        self._storage.discard()
         self._session = BridgeSession()
         self._gateway = None
         self._pending_requests = {}
@@ -90,7 +237,7 @@ class BridgeProvider(BaseProvider):
         resolve = loop.create_future()
 
         def on_request_sent(request_future: asyncio.Future):
-            asyncio.create_task(self._remove_session()) \
+            run_in_background(self._remove_session(), 'Session removal') \
                 .add_done_callback(lambda x: resolve.set_result(True) if not resolve.done() else None)
             request_future.set_result(None)
 
@@ -108,17 +255,40 @@ class BridgeProvider(BaseProvider):
         return await resolve
 
     def pause(self):
-        if self._gateway is not None:
-            self._gateway.pause()
+        for gateway in self._get_gateways():
+            gateway.pause()
 
     async def unpause(self):
-        if self._gateway is not None:
-            await self._gateway.unpause()
-
-    async def send_request(self, request: dict, on_request_sent=None):
+        await asyncio.gather(*[gateway.unpause() for gateway in self._get_gateways()])
+
+    async def ensure_listening(self):
+        """Open the bridge connection (all bridges of a multi-wallet connect) if it is paused."""
+        await asyncio.gather(*[gateway.ensure_listening() for gateway in self._get_gateways()])
+
+    async def flush(self):
+        """Write pending session changes to the storage."""
+        for gateway in self._get_gateways():
+            await gateway.flush()
+        await self._storage.flush()
+
+    async def send_request(self, request: dict, on_request_sent=None, timeout: float = None):
+        """Send the request to the wallet and wait for the response.
+
+        :param request: rpc request
+        :param on_request_sent: will be called with the response future after the request is sent
+        :param timeout: time in seconds to wait for the response, provider's `request_timeout` by default.
+            RequestTimeoutError is raised when it passes
+        """
         if not self._gateway or not self._session or not self._session.wallet_public_key:
             raise TonConnectError('Trying to send bridge request without session.')
 
+        if self._gateway.breaker.state == BridgeCircuitBreaker.OPEN:
+            await self._failover()
+
+        # lazily restored or paused session: the response can only be received with the stream opened
+        if not await self._gateway.ensure_listening():
+            raise TonConnectError(f'Bridge {self._gateway._bridge_url} connection could not be established.')
+
         req_id = request['id'] = await self._storage.increaseNextRpcRequestId()
         _LOGGER.debug(f'Provider send http-bridge request: {request}')
 
@@ -130,9 +300,16 @@ class BridgeProvider(BaseProvider):
         loop = asyncio.get_running_loop()
         resolve = loop.create_future()
 
-        self._pending_requests[req_id] = resolve
+        pending_requests = self._pending_requests
+        pending_requests[req_id] = resolve
+        resolve.add_done_callback(lambda _: pending_requests.pop(req_id, None))
+        self._timeout_wheel.add(resolve, self._request_timeout if timeout is None else timeout)
 
-        await self._gateway.send(encoded_request, self._session.wallet_public_key, request['method'])
+        try:
+            await self._gateway.send(encoded_request, self._session.wallet_public_key, request['method'])
+        except BaseException:
+            resolve.cancel()
+            raise
 
         if on_request_sent is not None:
             on_request_sent(resolve)
@@ -142,16 +319,21 @@ class BridgeProvider(BaseProvider):
     def listen(self, callback):
         self._listeners.append(callback)
 
-    async def _gateway_listener(self, bridge_incoming_message):
-        wallet_message = json.loads(
+    def _decrypt_message(self, bridge_incoming_message: dict) -> dict:
+        # decrypt stage of the gateway pipeline, may run in a worker thread
+        return json.loads(
             self._session.session_crypto.decrypt(bridge_incoming_message['message'],
                                                  bridge_incoming_message['from']))
 
+    async def _gateway_listener(self, bridge_incoming_message: dict, wallet_message: dict = None):
+        if wallet_message is None:
+            wallet_message = self._decrypt_message(bridge_incoming_message)
+
         _LOGGER.debug(f'Wallet message received: {wallet_message}')
 
         if 'event' not in wallet_message:
             if 'id' in wallet_message:
-                event_id = wallet_message['id']
+                event_id = str(wallet_message['id'])
                 if event_id not in self._pending_requests:
                     _LOGGER.debug(
                         f"Response id {event_id} doesn't match any request's id"
@@ -194,6 +376,34 @@ class BridgeProvider(BaseProvider):
         for listener in listeners:
             listener(wallet_message)
 
+    async def _pending_gateway_listener(self, bridge_url: str, bridge_incoming_message: dict,
+                                        wallet_message: dict = None):
+        if wallet_message is None:
+            wallet_message = self._decrypt_message(bridge_incoming_message)
+
+        if wallet_message.get('event') == 'connect' and bridge_url in self._pending_gateways:
+            self._choose_bridge(bridge_url, wallet_message)
+
+        await self._gateway_listener(bridge_incoming_message, wallet_message)
+
+    def _choose_bridge(self, bridge_url: str, connect_event: dict):
+        # the first wallet to connect wins, the other bridges are not listened anymore
+        self._gateway = self._pending_gateways.pop(bridge_url)
+        for gateway in self._pending_gateways.values():
+            gateway.close()
+        self._pending_gateways = {}
+
+        candidates = [wallet for wallet, url in self._wallet_bridges if url == bridge_url]
+        app_name = connect_event.get('payload', {}).get('device', {}).get('appName', '').lower()
+        self._wallet = next((wallet for wallet in candidates
+                             if app_name in (str(wallet.get('app_name')).lower(), str(wallet.get('name')).lower())),
+                            candidates[0])
+        self._wallet_bridges = []
+
+        self._session.bridge_url = bridge_url
+        self._session.bridge_urls = self._get_wallet_bridge_urls(self._wallet)
+        _LOGGER.debug(f'Wallet {self._wallet.get("name")} connected over bridge {bridge_url}')
+
     def _gateway_errors_listener(self, e=None):
         raise TonConnectError(f'Bridge error {json.dumps(e or {})}')
 
@@ -214,55 +424,101 @@ class BridgeProvider(BaseProvider):
             self.close_connection()
             await self._storage.removeConnection()
 
-    def _generate_universal_url(self, universal_url: str, request: dict):
-        is_ret_back = 'return_back' in request
+    async def _open_gateways(self, auto_listen=True):
+        if isinstance(self._wallet, dict):
+            self._gateway = self._create_gateway(self._session.bridge_url, self._gateway_listener)
 
-        if 'tg://' in universal_url or 't.me/' in universal_url:
-            return self._generate_tg_universal_url(universal_url, request, is_ret_back)
-        return self._generate_regular_universal_url(universal_url, request, is_ret_back)
+            if auto_listen:
+                await self._gateway.register_session()
 
-    def _generate_regular_universal_url(self, universal_url: str, request: dict, is_ret_back: bool = False):
-        version = 2
-        session_id = self._session.session_crypto.session_id
-        request_safe = quote_plus(json.dumps(request, separators=(',', ':'))).replace('+', '')
-
-        universal_base = universal_url.rstrip('/')
-        url = f'{universal_base}?v={version}&id={session_id}&r={request_safe}' + ('&ret=back' if is_ret_back else '')
-
-        return url
-
-    def _generate_tg_universal_url(self, universal_url: str, request: dict, is_ret_back: bool = False):
-        link = self._generate_regular_universal_url('about:blank', request, is_ret_back)
-        link_params = link.split('?')[1]
-        replaces = (
-            ('.', '%2E'),
-            ('-', '%2D'),
-            ('_', '%5F'),
-            ('&', '-'),
-            ('=', '__'),
-            ('%', '--'),
-            ('+', ''),
+    def _add_pending_gateway(self, wallet: dict, bridge_url: str):
+        if bridge_url not in self._pending_gateways:
+            self._pending_gateways[bridge_url] = self._create_gateway(
+                bridge_url, partial(self._pending_gateway_listener, bridge_url))
+        self._wallet_bridges.append((wallet, bridge_url))
+
+    def _create_gateway(self, bridge_url: str, listener) -> BridgeGateway:
+        return BridgeGateway(
+            self._storage,
+            bridge_url,
+            self._session.session_crypto.session_id,
+            listener,
+            self._gateway_errors_listener,
+            api_tokens=self._api_tokens,
+            http_pool=self._http_pool,
+            multiplexer=self._multiplexer,
+            decryptor=self._decrypt_message,
+            on_bridge_failure=self._failover,
+            wallet_public_key=self._session.wallet_public_key,
+            **self._gateway_options,
         )
-        for old, new in replaces:
-            link_params = link_params.replace(old, new)
-        start_attach = 'tonconnect-' + link_params
 
-        return universal_url + '&startattach=' + start_attach
+    def _create_session_crypto(self) -> SessionCrypto:
+        if self._session_key_pool is not None:
+            return self._session_key_pool.acquire()
+        return SessionCrypto()
+
+    def _get_gateways(self) -> list:
+        return [self._gateway] if self._gateway is not None else list(self._pending_gateways.values())
+
+    @staticmethod
+    def _get_wallet_bridge_urls(wallet: dict) -> list:
+        return wallet.get('bridge_urls') or ([wallet['bridge_url']] if 'bridge_url' in wallet else [])
+
+    async def _select_bridge(self, bridge_urls: list, exclude: str = None, wait: bool = True):
+        """Return the fastest healthy bridge of the wallet, None if there is no other bridge than `exclude`.
+        With `wait` False the cached latencies are used and the bridges are probed in background.
+        """
+        if len(bridge_urls) < 2:
+            return bridge_urls[0] if bridge_urls and bridge_urls[0] != exclude else None
+
+        if wait:
+            ranked = await self._bridge_selector.rank(bridge_urls, self._http_pool, self._get_reconnect_policy())
+        else:
+            ranked = self._bridge_selector.rank_cached(bridge_urls, self._http_pool, self._get_reconnect_policy())
+        exclude = exclude.rstrip('/') if exclude else None
+        # ranked urls are normalized, return the url as the wallet lists it
+        urls = {url.rstrip('/'): url for url in bridge_urls}
+        return next((urls[url] for url in ranked if url != exclude), None)
+
+    async def _failover(self) -> bool:
+        """Move the session to another bridge of the wallet when its bridge is down.
+        The session keys are kept, the last event id is tracked per bridge.
+
+        :return: True if the session was moved
+        """
+        if self._gateway is None or len(self._session.bridge_urls) < 2:
+            return False
 
-    async def _open_gateways(self, auto_listen=True):
-        if isinstance(self._wallet, dict):
-            self._gateway = BridgeGateway(
-                self._storage,
-                self._session.bridge_url,
-                self._session.session_crypto.session_id,
-                self._gateway_listener,
-                self._gateway_errors_listener,
-                api_tokens=self._api_tokens,
-            )
+        current = self._session.bridge_url
+        bridge_url = await self._select_bridge(self._session.bridge_urls, exclude=current)
+        if self._session.bridge_url != current:
+            return True  # moved by a concurrent failover
+        if bridge_url is None or self._bridge_selector.latencies.get(bridge_url.rstrip('/')) is None \
+                or self._get_reconnect_policy().get_breaker(bridge_url).state != BridgeCircuitBreaker.CLOSED:
+            return False  # no healthy bridge to move to
 
-            if auto_listen:
-                await self._gateway.register_session()
+        _LOGGER.warning(f'Session {self._session.session_crypto.session_id} moves from bridge {current} to {bridge_url}')
+        await self._gateway.flush()
+        self._session.bridge_url = bridge_url
+
+        connection = await self._storage.getConnection()
+        if 'session' in connection:
+            connection['session'] = self._session.get_dict()
+            await self._storage.setConnection(connection)
+
+        self._close_gateways()
+        await self._open_gateways()
+        return True
+
+    def _get_reconnect_policy(self) -> ReconnectPolicy:
+        if self._multiplexer is not None:
+            return self._multiplexer._reconnect_policy
+        return self._gateway_options['reconnect_policy'] or ReconnectPolicy.default()
 
     def _close_gateways(self):
         if self._gateway:
             self._gateway.close()
+        for gateway in self._pending_gateways.values():
+            gateway.close()
+        self._pending_gateways = {}
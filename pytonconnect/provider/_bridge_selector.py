@@ -0,0 +1,128 @@
+import asyncio
+import math
+import time
+
+from nacl.utils import random
+
+from pytonconnect.logger import _LOGGER
+
+from ._http_pool import HttpClientPool
+from ._reconnect import BridgeCircuitBreaker, ReconnectPolicy
+
+
+class BridgeSelector:
+    """Chooses the bridge to connect to among the bridges of a wallet.
+
+    Latency of a bridge is the time to open an SSE stream of a random session on it, results are cached
+    for `ttl` seconds (failures for `failure_ttl` seconds) and concurrent probes of the same bridge are shared.
+    Bridges that failed the probe or have an open circuit breaker are used only when no bridge is healthy.
+    `rank_cached()` never waits for a probe, it is used on the connect link path.
+    """
+
+    DEFAULT_PROBE_TIMEOUT = 5
+    DEFAULT_TTL = 300
+    DEFAULT_FAILURE_TTL = 10
+    SSE_PATH = 'events'
+
+    _default = None
+
+    _probe_timeout: float
+    _ttl: float
+    _failure_ttl: float
+    _latencies: dict
+    _probes: dict
+
+    def __init__(self, probe_timeout: float = DEFAULT_PROBE_TIMEOUT, ttl: float = DEFAULT_TTL,
+                 failure_ttl: float = DEFAULT_FAILURE_TTL):
+        """
+        :param probe_timeout: time in seconds after which a bridge is considered down
+        :param ttl: time in seconds to use a measured latency
+        :param failure_ttl: time in seconds to consider a bridge which failed the probe down
+        """
+        self._probe_timeout = probe_timeout
+        self._ttl = ttl
+        self._failure_ttl = failure_ttl
+        self._latencies = {}  # bridge url -> (measured at, latency in seconds or None if failed)
+        self._probes = {}  # bridge url -> task measuring it
+
+    @classmethod
+    def default(cls) -> 'BridgeSelector':
+        """Process-wide selector used when no selector is passed explicitly."""
+        if cls._default is None:
+            cls._default = cls()
+        return cls._default
+
+    @property
+    def latencies(self) -> dict:
+        """Last measured latencies: bridge url -> seconds, None if the bridge failed the probe."""
+        return {url: latency for url, (_, latency) in self._latencies.items()}
+
+    async def rank(self, bridge_urls: list, http_pool: HttpClientPool = None,
+                   reconnect_policy: ReconnectPolicy = None) -> list:
+        """Return the bridges ordered from the best: healthy ones by latency, then the others in given order."""
+        bridge_urls = [url.rstrip('/') for url in bridge_urls]
+        latencies = await asyncio.gather(*[self.measure(url, http_pool) for url in bridge_urls])
+        return self._sort(bridge_urls, latencies, reconnect_policy)
+
+    def rank_cached(self, bridge_urls: list, http_pool: HttpClientPool = None,
+                    reconnect_policy: ReconnectPolicy = None) -> list:
+        """Order the bridges like `rank()` by the cached latencies without waiting, bridges not measured yet
+        go after the measured healthy ones in given order. Bridges without a fresh latency are probed in background.
+        """
+        bridge_urls = [url.rstrip('/') for url in bridge_urls]
+        latencies = []
+        for url in bridge_urls:
+            cached = self._get_cached(url)
+            if cached is None:
+                self._start_probe(url, http_pool)
+            # a bridge not measured yet is taken as healthy but slower than every measured one
+            latencies.append(math.inf if cached is None else cached[1])
+        return self._sort(bridge_urls, latencies, reconnect_policy)
+
+    async def measure(self, bridge_url: str, http_pool: HttpClientPool = None):
+        """Return the latency of the bridge in seconds or None if it is down."""
+        bridge_url = bridge_url.rstrip('/')
+        cached = self._get_cached(bridge_url)
+        if cached is not None:
+            return cached[1]
+        return await asyncio.shield(self._start_probe(bridge_url, http_pool))
+
+    def _get_cached(self, bridge_url: str):
+        # (measured at, latency) if it is still fresh, failures expire sooner to notice a recovered bridge
+        cached = self._latencies.get(bridge_url)
+        if cached is None:
+            return None
+        ttl = self._ttl if cached[1] is not None else self._failure_ttl
+        return cached if time.monotonic() - cached[0] < ttl else None
+
+    def _start_probe(self, bridge_url: str, http_pool: HttpClientPool) -> asyncio.Task:
+        probe = self._probes.get(bridge_url)
+        if probe is None or probe.done():
+            probe = self._probes[bridge_url] = asyncio.get_running_loop().create_task(
+                self._probe(bridge_url, http_pool or HttpClientPool.default()))
+        return probe
+
+    def _sort(self, bridge_urls: list, latencies: list, reconnect_policy: ReconnectPolicy) -> list:
+        policy = reconnect_policy or ReconnectPolicy.default()
+
+        def key(item):
+            index, (url, latency) = item
+            healthy = latency is not None and policy.get_breaker(url).state == BridgeCircuitBreaker.CLOSED
+            return (0, latency, index) if healthy else (1, 0, index)
+
+        return [url for _, (url, _) in sorted(enumerate(zip(bridge_urls, latencies)), key=key)]
+
+    async def _probe(self, bridge_url: str, http_pool: HttpClientPool):
+        url = f'{bridge_url}/{self.SSE_PATH}?client_id={random(32).hex()}'
+        started = time.monotonic()
+        try:
+            client = http_pool.get_client(url)
+            async with client.stream('GET', url, timeout=self._probe_timeout) as response:
+                response.raise_for_status()
+            latency = time.monotonic() - started
+        except Exception as e:
+            _LOGGER.warning(f'Bridge {bridge_url} probe failed {type(e)}: {e}')
+            latency = None
+
+        self._latencies[bridge_url] = (time.monotonic(), latency)
+        return latency
@@ -6,14 +6,30 @@ from pytonconnect.crypto import SessionCrypto
 class BridgeSession:
 
     session_crypto: SessionCrypto
-    wallet_public_key: str
     bridge_url: str
+    bridge_urls: list  # all bridges of the wallet, `bridge_url` is the one in use
+
+    _wallet_public_key: str
+
+    @property
+    def wallet_public_key(self):
+        return self._wallet_public_key
+
+    @wallet_public_key.setter
+    def wallet_public_key(self, value: str):
+        # wallet key changed, shared key with the previous one is not needed anymore
+        if self.session_crypto is not None and self._wallet_public_key and self._wallet_public_key != value:
+            self.session_crypto.forget_peer(self._wallet_public_key)
+        self._wallet_public_key = value
 
     def __init__(self, stored: dict = None):
+        self._wallet_public_key = None
         self.session_crypto = SessionCrypto(stored['session_private_key']) \
             if stored and 'session_private_key' in stored else None
         self.wallet_public_key = stored['wallet_public_key'] if stored and 'wallet_public_key' in stored else None
         self.bridge_url = stored['bridge_url'] if stored and 'bridge_url' in stored else None
+        self.bridge_urls = stored['bridge_urls'] if stored and 'bridge_urls' in stored \
+            else [self.bridge_url] if self.bridge_url else []
 
     def __repr__(self):
         return json.dumps(self.get_dict())
@@ -23,4 +39,5 @@ class BridgeSession:
             'session_private_key': self.session_crypto.key_pair.encode().hex(),
             'wallet_public_key': self.wallet_public_key,
             'bridge_url': self.bridge_url,
+            'bridge_urls': self.bridge_urls,
         }
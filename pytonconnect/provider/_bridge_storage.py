@@ -1,71 +1,294 @@
+import asyncio
 import json
 from hashlib import sha256
 
+from pytonconnect._background import call_later_in_background
 from pytonconnect.storage import IStorage
 
 
+class RpcRequestIdAllocator:
+    """Hands out rpc request ids from ranges reserved in the storage with one write per range.
+
+    The stored `next_rpc_request_id` is the first id not reserved yet, so ids stay monotonic
+    across restarts. Processes sharing the storage reserve disjoint ranges only if the backend's
+    `update()` is atomic between processes (`SqliteStorage`), `FileStorage`, `LogFileStorage`
+    and `DefaultStorage` guarantee it for one process only.
+    """
+
+    DEFAULT_BLOCK_SIZE = 64
+
+    _storage: 'BridgeProviderStorage'
+    _block_size: int
+    _next_id: int
+    _lease_end: int
+    _lock: asyncio.Lock
+
+    def __init__(self, storage: 'BridgeProviderStorage', block_size: int = DEFAULT_BLOCK_SIZE):
+        self._storage = storage
+        self._block_size = max(1, block_size)
+        self._next_id = None
+        self._lease_end = None
+        self._lock = None
+
+    async def allocate(self):
+        """Return the next request id or None if there is no connection."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            if self._next_id is None or self._next_id >= self._lease_end:
+                start = await self._storage.reserveRpcRequestIds(self._block_size)
+                if start is None:
+                    return None
+                self._next_id, self._lease_end = start, start + self._block_size
+
+            req_id = self._next_id
+            self._next_id += 1
+            return str(req_id)
+
+    def reset(self):
+        """Forget the current range, e.g. when the connection record is replaced."""
+        self._next_id = None
+        self._lease_end = None
+
+
 class BridgeProviderStorage:
+    """Connection record of the provider.
+
+    The parsed record is kept in memory as the source of truth, updates of the hot-path counters
+    (last wallet event id, rpc request id) are written to the storage according to the flush policy:
+    immediately, debounced by `flush_delay` seconds or only on `flush()`/`close()`.
+    """
+
+    FLUSH_IMMEDIATE = 'immediate'
+    FLUSH_DEBOUNCED = 'debounced'
+    FLUSH_ON_CLOSE = 'on_close'
+    DEFAULT_FLUSH_DELAY = 1.0
 
     _storage: IStorage
+    _flush_policy: str
+    _flush_delay: float
+
+    _connection: dict
+    _dirty: bool
+    _flush_handle: asyncio.TimerHandle
+    _rpc_request_ids: RpcRequestIdAllocator
 
     @property
     def storage(self):
         return self._storage
 
-    def __init__(self, storage: IStorage):
+    @property
+    def dirty(self):
+        """Shows if the record has changes not written to the storage yet."""
+        return self._dirty
+
+    def __init__(self,
+                 storage: IStorage,
+                 flush_policy: str = FLUSH_IMMEDIATE,
+                 flush_delay: float = DEFAULT_FLUSH_DELAY,
+                 rpc_request_id_block_size: int = RpcRequestIdAllocator.DEFAULT_BLOCK_SIZE):
+        if flush_policy not in (self.FLUSH_IMMEDIATE, self.FLUSH_DEBOUNCED, self.FLUSH_ON_CLOSE):
+            raise ValueError(f'Unknown flush policy {flush_policy}')
+
         self._storage = storage
+        self._flush_policy = flush_policy
+        self._flush_delay = flush_delay
+
+        self._connection = None
+        self._dirty = False
+        self._flush_handle = None
+        self._rpc_request_ids = RpcRequestIdAllocator(self, rpc_request_id_block_size)
 
     async def setConnection(self, connection: dict):
-        await self._storage.set_item(IStorage.KEY_CONNECTION,
-                                     json.dumps(connection, indent=2))
+        self._cancel_flush()
+        self._connection = connection
+        self._dirty = False
+        self._rpc_request_ids.reset()
+        await self._storage.set_item(IStorage.KEY_CONNECTION, json.dumps(connection))
 
     async def removeConnection(self):
+        self._cancel_flush()
+        self._connection = {}
+        self._dirty = False
+        self._rpc_request_ids.reset()
         await self._storage.remove_item(IStorage.KEY_CONNECTION)
 
     async def getConnection(self) -> dict:
-        return json.loads(await self._storage.get_item(IStorage.KEY_CONNECTION, "{}"))
+        if self._connection is None:
+            self._connection = json.loads(await self._storage.get_item(IStorage.KEY_CONNECTION, "{}"))
+        return self._connection
 
     async def setLastWalletEventId(self, event_id: int):
         connection = await self.getConnection()
         if connection and 'connect_event' in connection:
             connection['last_wallet_event_id'] = str(event_id)
-            await self.setConnection(connection)
+            await self._mark_dirty()
 
     async def getLastWalletEventId(self):
         connection = await self.getConnection()
-        return connection['last_wallet_event_id'] if 'last_wallet_event_id' in connection else 0
+        return int(connection.get('last_wallet_event_id') or 0)
 
     async def increaseNextRpcRequestId(self):
+        return await self._rpc_request_ids.allocate()
+
+    async def reserveRpcRequestIds(self, count: int):
+        """Reserve `count` request ids in the storage and return the first one.
+        Always written immediately with an atomic storage update, whatever the flush policy is.
+        """
         connection = await self.getConnection()
-        if connection and 'next_rpc_request_id' in connection:
-            req_id = connection.get('next_rpc_request_id', '0')
-            connection['next_rpc_request_id'] = str(int(req_id) + 1)
-            await self.setConnection(connection)
-            return req_id
+        if not connection or 'next_rpc_request_id' not in connection:
+            return None
+
+        # pending changes are written together with the reservation
+        self._cancel_flush()
+        return await self._write(connection, count)
+
+    async def flush(self):
+        """Write pending changes of the record to the storage."""
+        self._cancel_flush()
+        if self._dirty and self._connection is not None:
+            await self._write(self._connection)
+
+    async def close(self):
+        await self.flush()
+
+    def discard(self):
+        """Drop pending changes and the in-memory record, next read goes to the storage."""
+        self._cancel_flush()
+        self._connection = None
+        self._dirty = False
+        self._rpc_request_ids.reset()
+
+    async def _write(self, connection: dict, reserve: int = 0):
+        """Write the record with an atomic storage update and return the first reserved rpc request id.
+
+        The stored `next_rpc_request_id` may be ahead of the local one when another process sharing
+        the storage reserved a range, the larger one is kept so the reserved ranges are never rolled back.
+        The update function runs on the storage worker thread for some backends, so it only touches
+        its own copy of the record.
+        """
+        record = dict(connection)
+        reserved = {}
+
+        def merge(stored_value):
+            if 'next_rpc_request_id' in record:
+                stored = json.loads(stored_value or '{}')
+                start = max(int(record.get('next_rpc_request_id') or 0), int(stored.get('next_rpc_request_id') or 0))
+                record['next_rpc_request_id'] = str(start + reserve)
+                reserved['start'] = start
+            return json.dumps(record)
+
+        # the record stays dirty if the write fails, changes made while writing mark it dirty again
+        dirty, self._dirty = self._dirty, False
+        try:
+            await self._storage.update(IStorage.KEY_CONNECTION, merge)
+        except BaseException:
+            self._dirty = self._dirty or dirty
+            raise
+
+        if 'next_rpc_request_id' in record:
+            connection['next_rpc_request_id'] = record['next_rpc_request_id']
+        return reserved.get('start')
+
+    async def _mark_dirty(self):
+        self._dirty = True
+        if self._flush_policy == self.FLUSH_IMMEDIATE:
+            await self.flush()
+        elif self._flush_policy == self.FLUSH_DEBOUNCED and self._flush_handle is None:
+            self._flush_handle = call_later_in_background(self._flush_delay, self.flush, 'Connection record flush')
+
+    def _cancel_flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
 
 
 class BridgeGatewayStorage:
+    """Last event id of the bridge stream of the session.
+
+    The id is kept in memory and written to the storage every `flush_events` events, `flush_interval`
+    seconds after the first unwritten event, and on `flush()` (the gateway flushes on pause and close).
+    By default every event is written at once.
+
+    Crash safety: the ids not written yet are lost with the process, the bridge then delivers these events
+    once more when the session is restored (at-least-once delivery). The window is at most
+    `flush_events` events or `flush_interval` seconds, repeated wallet events are dropped by the provider
+    by their wallet event id and repeated responses don't match any pending request.
+    """
+
+    DEFAULT_FLUSH_EVENTS = 1
 
     _storage: IStorage
     __key_last_event_id: str
+    _flush_events: int
+    _flush_interval: float
+
+    _last_event_id: str
+    _unwritten_count: int
+    _flush_handle: asyncio.TimerHandle
 
     @property
     def storage(self):
         return self._storage
 
-    def __init__(self, provider_storage: BridgeProviderStorage, bridge_url: str):
+    def __init__(self,
+                 provider_storage: BridgeProviderStorage,
+                 bridge_url: str,
+                 flush_events: int = DEFAULT_FLUSH_EVENTS,
+                 flush_interval: float = None):
+        """
+        :param flush_events: write the id after this number of events, 0 is only by time or on flush
+        :param flush_interval: time in seconds to write the id after the first unwritten event, None is never
+        """
         bridge_url = sha256(bridge_url.encode()).hexdigest()[:6]
         self._storage = provider_storage.storage
         self.__key_last_event_id = f'{IStorage.KEY_LAST_EVENT_ID}:{bridge_url}'
+        self._flush_events = flush_events
+        self._flush_interval = flush_interval
+
+        self._last_event_id = None
+        self._unwritten_count = 0
+        self._flush_handle = None
 
     async def setLastEventId(self, last_event_id: str):
-        await self._storage.set_item(self.__key_last_event_id, last_event_id)
+        self._last_event_id = last_event_id
+        self._unwritten_count += 1
+
+        if self._flush_events and self._unwritten_count >= self._flush_events:
+            await self.flush()
+        elif self._flush_interval is not None and self._flush_handle is None:
+            self._flush_handle = call_later_in_background(self._flush_interval, self.flush, 'Last event id flush')
 
     async def removeLastEventId(self):
+        self._cancel_flush()
+        self._last_event_id = None
+        self._unwritten_count = 0
         await self._storage.remove_item(self.__key_last_event_id)
 
     async def getLastEventId(self):
-        last_event_id = await self._storage.get_item(self.__key_last_event_id)
+        if self._last_event_id is not None:
+            return self._last_event_id
+
+        last_event_ids = await self._storage.get_many([self.__key_last_event_id, IStorage.KEY_LAST_EVENT_ID])
+        last_event_id = last_event_ids[self.__key_last_event_id]
         if last_event_id is None:
-            last_event_id = await self._storage.get_item(IStorage.KEY_LAST_EVENT_ID)
+            last_event_id = last_event_ids[IStorage.KEY_LAST_EVENT_ID]
         return last_event_id
+
+    async def flush(self):
+        """Write the last event id if it is not written yet."""
+        self._cancel_flush()
+        if self._unwritten_count and self._last_event_id is not None:
+            self._unwritten_count = 0
+            await self._storage.set_item(self.__key_last_event_id, self._last_event_id)
+
+    def discard(self):
+        """Drop the id not written yet."""
+        self._cancel_flush()
+        self._unwritten_count = 0
+
+    def _cancel_flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
@@ -0,0 +1,83 @@
+import asyncio
+import weakref
+from urllib.parse import urlsplit
+
+from httpx import AsyncClient, Limits
+
+
+class HttpClientPool:
+    """Shared keep-alive HTTP clients for bridge requests, one `AsyncClient` per bridge host.
+
+    Clients are bound to the event loop they were created in, so a pool can safely be reused
+    by code that runs several event loops one after another.
+    """
+
+    DEFAULT_MAX_CONNECTIONS = None  # SSE streams hold a connection each, so unlimited by default
+    DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 20
+    DEFAULT_KEEPALIVE_EXPIRY = 30
+
+    _default = None
+
+    _limits: Limits
+    _client_kwargs: dict
+    _clients: weakref.WeakKeyDictionary
+
+    def __init__(self,
+                 max_connections: int = DEFAULT_MAX_CONNECTIONS,
+                 max_keepalive_connections: int = DEFAULT_MAX_KEEPALIVE_CONNECTIONS,
+                 keepalive_expiry: float = DEFAULT_KEEPALIVE_EXPIRY,
+                 **client_kwargs):
+        """
+        :param max_connections: maximum number of connections per bridge host (None is unlimited)
+        :param max_keepalive_connections: maximum number of idle connections kept alive per bridge host
+        :param keepalive_expiry: time in seconds to keep an idle connection alive
+        :param client_kwargs: additional arguments for `httpx.AsyncClient`
+        """
+        self._limits = Limits(max_connections=max_connections,
+                              max_keepalive_connections=max_keepalive_connections,
+                              keepalive_expiry=keepalive_expiry)
+        self._client_kwargs = client_kwargs
+        self._clients = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def default(cls) -> 'HttpClientPool':
+        """Process-wide pool used when no pool is passed explicitly."""
+        if cls._default is None:
+            cls._default = cls()
+        return cls._default
+
+    def get_client(self, url: str) -> AsyncClient:
+        """Return the client for the host of `url`, creating it on first use.
+
+        :param url: any url of the bridge
+        """
+        clients = self._get_loop_clients()
+        key = self._get_key(url)
+        client = clients.get(key)
+        if client is None or client.is_closed:
+            client = AsyncClient(limits=self._limits, **self._client_kwargs)
+            clients[key] = client
+        return client
+
+    async def aclose(self):
+        """Close all clients created in the running event loop."""
+        clients = self._clients.pop(asyncio.get_running_loop(), {})
+        for client in clients.values():
+            await client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.aclose()
+
+    def _get_loop_clients(self) -> dict:
+        loop = asyncio.get_running_loop()
+        clients = self._clients.get(loop)
+        if clients is None:
+            clients = self._clients[loop] = {}
+        return clients
+
+    def _get_key(self, url: str) -> str:
+        parts = urlsplit(url)
+        return f'{parts.scheme}://{parts.netloc}'
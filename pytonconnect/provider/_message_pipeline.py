@@ -0,0 +1,71 @@
+import asyncio
+from concurrent.futures import Executor
+
+from pytonconnect.logger import _LOGGER
+
+
+class MessagePipeline:
+    """Processes bridge messages of one SSE stream in stages: receive → parse → decrypt → dispatch.
+
+    The stream reader only puts messages into a bounded queue and waits when `maxsize` messages are not
+    dispatched yet, so a slow consumer slows down reading from the bridge instead of piling up memory.
+    The decrypt stage runs in `executor` when it is given (several messages are decrypted at once),
+    otherwise right before the dispatch. Messages are always dispatched in the order they were received.
+    """
+
+    DEFAULT_MAXSIZE = 100
+
+    _executor: Executor
+    _queue: asyncio.Queue
+    _task: asyncio.Task
+    _name: str
+
+    def __init__(self, maxsize: int = DEFAULT_MAXSIZE, executor: Executor = None, name: str = 'bridge'):
+        """
+        :param maxsize: maximum number of received messages waiting for the dispatch
+        :param executor: executor for the decrypt stage, the event loop thread if None
+        :param name: name of the stream for logs
+        """
+        self._executor = executor
+        self._queue = asyncio.Queue(maxsize)
+        self._task = None
+        self._name = name
+
+    @property
+    def pending_count(self) -> int:
+        """Number of received messages not dispatched yet."""
+        return self._queue.qsize()
+
+    async def put(self, decrypt, dispatch):
+        """Queue a parsed message.
+
+        :param decrypt: sync callable of the decrypt stage, it must be thread-safe if the executor is used
+        :param dispatch: async callable receiving the result of `decrypt`
+        """
+        if self._executor is not None:
+            decrypted = asyncio.get_running_loop().run_in_executor(self._executor, decrypt)
+        else:
+            decrypted = decrypt
+        await self._queue.put((decrypted, dispatch))
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def clear(self):
+        """Drop the messages waiting for the dispatch, the message being dispatched is finished."""
+        while not self._queue.empty():
+            decrypted, _ = self._queue.get_nowait()
+            if isinstance(decrypted, asyncio.Future):
+                decrypted.cancel()
+
+    async def _run(self):
+        while not self._queue.empty():
+            decrypted, dispatch = self._queue.get_nowait()
+            try:
+                result = await decrypted if isinstance(decrypted, asyncio.Future) else decrypted()
+                await dispatch(result)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # one broken message must not stop the messages after it
+                _LOGGER.exception(f'Bridge message handling failed ({self._name})')
@@ -0,0 +1,157 @@
+import asyncio
+import random
+import time
+
+
+class BridgeCircuitBreaker:
+    """Health of one bridge shared by all its streams.
+
+    After `failure_threshold` failed connections in a row the breaker opens: nobody connects to the bridge
+    for `reset_timeout` seconds, then one stream probes it (half-open) while the others wait.
+    A successful connection closes the breaker and releases the waiting streams at once.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    _failure_threshold: int
+    _reset_timeout: float
+    _opened_at: float
+    _probe_until: float
+    _closed_event: asyncio.Event
+    _loop: asyncio.AbstractEventLoop
+
+    bridge_url: str
+    failures: int
+
+    def __init__(self, bridge_url: str, failure_threshold: int, reset_timeout: float):
+        self.bridge_url = bridge_url
+        self.failures = 0
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._opened_at = None
+        self._probe_until = 0  # a probe not answered in `reset_timeout` is considered lost
+        self._closed_event = None
+        self._loop = None
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return self.CLOSED
+        if time.monotonic() >= self._opened_at + self._reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def record_success(self):
+        self.failures = 0
+        self._opened_at = None
+        self._probe_until = 0
+        if self._closed_event is not None:
+            self._closed_event.set()
+            self._closed_event = None
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_until = 0
+        if self._opened_at is not None or self.failures >= self._failure_threshold:
+            # a failed probe opens the breaker for another `reset_timeout`
+            self._opened_at = time.monotonic()
+
+    async def wait(self):
+        """Wait until a connection to the bridge is allowed."""
+        while self._opened_at is not None:
+            now = time.monotonic()
+            retry_in = max(self._opened_at + self._reset_timeout, self._probe_until) - now
+            if retry_in <= 0:
+                self._probe_until = now + self._reset_timeout
+                return
+
+            loop = asyncio.get_running_loop()
+            if self._closed_event is None or self._loop is not loop:
+                self._closed_event, self._loop = asyncio.Event(), loop
+            try:
+                await asyncio.wait_for(self._closed_event.wait(), retry_in)
+            except asyncio.TimeoutError:
+                pass
+
+
+class ReconnectPolicy:
+    """Decides when a broken bridge stream is reconnected.
+
+    Delays grow exponentially from `base_delay` up to `max_delay`, every delay is randomly shortened
+    by up to `jitter` of it, so streams broken at the same moment don't reconnect at the same moment.
+    After `max_attempts` failed reconnects in a row the stream stays closed until it is needed again
+    (e.g. by the next request). Streams of the same bridge share a BridgeCircuitBreaker of the policy.
+    """
+
+    DEFAULT_BASE_DELAY = 1
+    DEFAULT_MAX_DELAY = 60
+    DEFAULT_MULTIPLIER = 2
+    DEFAULT_JITTER = 0.5
+    DEFAULT_FAILURE_THRESHOLD = 5
+    DEFAULT_RESET_TIMEOUT = 30
+
+    _default = None
+
+    _base_delay: float
+    _max_delay: float
+    _multiplier: float
+    _jitter: float
+    _max_attempts: int
+    _failure_threshold: int
+    _reset_timeout: float
+    _breakers: dict
+
+    def __init__(self,
+                 base_delay: float = DEFAULT_BASE_DELAY,
+                 max_delay: float = DEFAULT_MAX_DELAY,
+                 multiplier: float = DEFAULT_MULTIPLIER,
+                 jitter: float = DEFAULT_JITTER,
+                 max_attempts: int = None,
+                 failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout: float = DEFAULT_RESET_TIMEOUT):
+        """
+        :param base_delay: delay in seconds before the first reconnect
+        :param max_delay: maximum delay in seconds
+        :param multiplier: growth of the delay after every failed reconnect
+        :param jitter: part of the delay (0..1) that is randomized
+        :param max_attempts: maximum number of reconnects in a row, None is unlimited
+        :param failure_threshold: failed connections in a row that open the bridge circuit breaker
+        :param reset_timeout: time in seconds the open circuit breaker rejects connections
+        """
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._multiplier = multiplier
+        self._jitter = jitter
+        self._max_attempts = max_attempts
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._breakers = {}
+
+    @classmethod
+    def default(cls) -> 'ReconnectPolicy':
+        """Process-wide policy used when no policy is passed explicitly."""
+        if cls._default is None:
+            cls._default = cls()
+        return cls._default
+
+    @property
+    def degraded_bridges(self) -> dict:
+        """Bridges with failing connections: bridge url -> BridgeCircuitBreaker."""
+        return {url: breaker for url, breaker in self._breakers.items() if breaker.failures}
+
+    def get_delay(self, attempt: int):
+        """Return delay in seconds before the reconnect `attempt` (from 1) or None to stop reconnecting."""
+        if self._max_attempts is not None and attempt > self._max_attempts:
+            return None
+        delay = min(self._max_delay, self._base_delay * self._multiplier ** max(attempt - 1, 0))
+        return delay * (1 - self._jitter * random.random())
+
+    def get_breaker(self, bridge_url: str) -> BridgeCircuitBreaker:
+        bridge_url = bridge_url.rstrip('/')
+        breaker = self._breakers.get(bridge_url)
+        if breaker is None:
+            breaker = self._breakers[bridge_url] = BridgeCircuitBreaker(
+                bridge_url, self._failure_threshold, self._reset_timeout)
+        return breaker
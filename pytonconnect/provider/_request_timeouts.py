@@ -0,0 +1,103 @@
+import asyncio
+import math
+
+from pytonconnect.exceptions import RequestTimeoutError
+
+
+class RequestTimeoutWheel:
+    """Fails futures of pending wallet requests when their deadline passes.
+
+    Deadlines are put into buckets of `resolution` seconds and one task expires whole buckets,
+    so thousands of pending requests cost one timer instead of one per request.
+    A request times out at most `resolution` seconds after its deadline.
+    The wheel is bound to the event loop it is used in, like `HttpClientPool` it can be reused
+    by event loops running one after another.
+    """
+
+    DEFAULT_RESOLUTION = 1
+
+    _default = None
+
+    _resolution: float
+    _loop: asyncio.AbstractEventLoop
+    _buckets: dict
+    _slots: dict
+    _task: asyncio.Task
+
+    scheduled_count: int
+    expired_count: int
+
+    def __init__(self, resolution: float = DEFAULT_RESOLUTION):
+        """
+        :param resolution: width of a bucket in seconds
+        """
+        self._resolution = resolution
+        self._loop = None
+        self._buckets = {}  # slot -> set of futures
+        self._slots = {}  # future -> slot
+        self._task = None
+
+        self.scheduled_count = 0
+        self.expired_count = 0
+
+    @classmethod
+    def default(cls) -> 'RequestTimeoutWheel':
+        """Process-wide wheel used when no wheel is passed explicitly."""
+        if cls._default is None:
+            cls._default = cls()
+        return cls._default
+
+    @property
+    def pending_count(self) -> int:
+        """Number of futures waiting for their deadline."""
+        return len(self._slots)
+
+    def add(self, future: asyncio.Future, timeout: float):
+        """Fail the future with RequestTimeoutError if it is not done in `timeout` seconds.
+
+        :param future: future of the pending request, it is forgotten as soon as it is done
+        :param timeout: time in seconds
+        """
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._reset(loop)
+
+        slot = math.ceil((loop.time() + max(timeout, 0)) / self._resolution)
+        self._buckets.setdefault(slot, set()).add(future)
+        self._slots[future] = slot
+        self.scheduled_count += 1
+        future.add_done_callback(self._discard)
+
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._sweep())
+
+    def _discard(self, future: asyncio.Future):
+        slot = self._slots.pop(future, None)
+        bucket = self._buckets.get(slot)
+        if bucket is not None:
+            bucket.discard(future)
+            if not bucket:
+                del self._buckets[slot]
+
+    def _reset(self, loop: asyncio.AbstractEventLoop):
+        # futures of a previous event loop can't be awaited anymore
+        self._loop = loop
+        self._buckets = {}
+        self._slots = {}
+        self._task = None
+
+    async def _sweep(self):
+        loop = asyncio.get_running_loop()
+        while self._buckets:
+            next_slot = min(self._buckets)
+            delay = next_slot * self._resolution - loop.time()
+            if delay > 0:
+                # tick every bucket, a request with a shorter timeout may be added in between
+                await asyncio.sleep(min(delay, self._resolution))
+                continue
+
+            for future in self._buckets.pop(next_slot, ()):
+                self._slots.pop(future, None)
+                if not future.done():
+                    self.expired_count += 1
+                    future.set_exception(RequestTimeoutError())
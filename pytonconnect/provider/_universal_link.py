@@ -0,0 +1,57 @@
+import json
+from urllib.parse import quote_plus
+
+
+class UniversalLinkTemplate:
+    """Universal link of a connect request with the session id left to fill in.
+
+    The request is encoded once (and escaped for Telegram links once), so links of the same request
+    for many sessions are built by string concatenation only.
+    """
+
+    PROTOCOL_VERSION = 2
+    STANDART_UNIVERSAL_URL = 'tc://'
+    TG_REPLACES = (
+        ('.', '%2E'),
+        ('-', '%2D'),
+        ('_', '%5F'),
+        ('&', '-'),
+        ('=', '__'),
+        ('%', '--'),
+        ('+', ''),
+    )
+
+    _prefix: str
+    _suffix: str
+
+    def __init__(self, universal_url: str, request: dict):
+        """
+        :param universal_url: universal link of the wallet
+        :param request: connect request
+        """
+        request_safe = quote_plus(json.dumps(request, separators=(',', ':'))).replace('+', '')
+        ret_back = '&ret=back' if 'return_back' in request else ''
+
+        # the session id is hex, the Telegram escaping doesn't change it, so prefix and suffix are escaped apart
+        if 'tg://' in universal_url or 't.me/' in universal_url:
+            self._prefix = f'{universal_url}&startattach=tonconnect-' \
+                + self._escape_tg(f'v={self.PROTOCOL_VERSION}&id=')
+            self._suffix = self._escape_tg(f'&r={request_safe}{ret_back}')
+        else:
+            universal_base = universal_url.rstrip('/')
+            self._prefix = f'{universal_base}?v={self.PROTOCOL_VERSION}&id='
+            self._suffix = f'&r={request_safe}{ret_back}'
+
+    @classmethod
+    def for_wallet(cls, wallet: dict, request: dict) -> 'UniversalLinkTemplate':
+        """Template of the wallet's universal link, `tc://` if the wallet has none."""
+        return cls(wallet.get('universal_url', cls.STANDART_UNIVERSAL_URL), request)
+
+    def format(self, session_id: str) -> str:
+        """Return the universal link of the session."""
+        return self._prefix + session_id + self._suffix
+
+    def _escape_tg(self, link_params: str) -> str:
+        for old, new in self.TG_REPLACES:
+            link_params = link_params.replace(old, new)
+        return link_params
@@ -1,9 +1,15 @@
 from ._default_storage import DefaultStorage
 from ._file_storage import FileStorage
 from ._interface import IStorage
+from ._log_file_storage import LogFileStorage
+from ._namespaced_storage import NamespacedStorage
+from ._sqlite_storage import SqliteStorage
 
 __all__ = [
     'IStorage',
     'DefaultStorage',
     'FileStorage',
+    'LogFileStorage',
+    'NamespacedStorage',
+    'SqliteStorage',
 ]
@@ -19,3 +19,23 @@ class DefaultStorage(IStorage):
     async def remove_item(self, key: str):
         if key in self._cache:
             del self._cache[key]
+
+    async def get_many(self, keys: list, default_value: str = None) -> dict:
+        return {key: self._cache.get(key, default_value) for key in keys}
+
+    async def set_many(self, items: dict):
+        self._cache.update(items)
+
+    async def remove_many(self, keys: list):
+        for key in keys:
+            self._cache.pop(key, None)
+
+    async def update(self, key: str, fn, default_value: str = None):
+        value = fn(self._cache.get(key, default_value))
+        if value == self._cache.get(key):
+            return value
+        if value is None:
+            self._cache.pop(key, None)
+        else:
+            self._cache[key] = value
+        return value
@@ -41,3 +41,30 @@ class FileStorage(IStorage):
         if key in data:
             del data[key]
             self._write_to_file(data)
+
+    async def get_many(self, keys: list, default_value: str = None) -> dict:
+        data = self._read_from_file() if self._cache is None else self._cache
+        return {key: data.get(key, default_value) for key in keys}
+
+    async def set_many(self, items: dict):
+        data = self._read_from_file() if self._cache is None else self._cache
+        data.update(items)
+        self._write_to_file(data)
+
+    async def remove_many(self, keys: list):
+        data = self._read_from_file() if self._cache is None else self._cache
+        removed = [data.pop(key) for key in keys if key in data]
+        if removed:
+            self._write_to_file(data)
+
+    async def update(self, key: str, fn, default_value: str = None):
+        data = self._read_from_file() if self._cache is None else self._cache
+        value = fn(data.get(key, default_value))
+        if value == data.get(key):
+            return value
+        if value is None:
+            del data[key]
+        else:
+            data[key] = value
+        self._write_to_file(data)
+        return value
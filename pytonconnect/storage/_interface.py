@@ -1,3 +1,4 @@
+import asyncio
 from abc import ABCMeta, abstractmethod
 
 
@@ -6,6 +7,8 @@ class IStorage(metaclass=ABCMeta):
     KEY_LAST_EVENT_ID = 'last_event_id'
     KEY_CONNECTION = 'connection'
 
+    _update_lock: asyncio.Lock = None
+
     @abstractmethod
     async def set_item(self, key: str, value: str):
         """Save the `value` to the storage. Value can be accessed later by the `key`.
@@ -31,3 +34,74 @@ class IStorage(metaclass=ABCMeta):
         :param key: key to remove the value
         """
         raise NotImplementedError
+
+    async def get_many(self, keys: list, default_value: str = None) -> dict:
+        """Read several values from the storage.
+        Default implementation reads the keys one by one, override it if the backend can do better.
+
+        :param keys: keys to access the values
+        :param default_value: default value for keys not found in storage
+        :return: dict of key -> value
+        """
+        return {key: await self.get_item(key, default_value) for key in keys}
+
+    async def set_many(self, items: dict):
+        """Save several values to the storage.
+
+        :param items: dict of key -> value to save
+        """
+        for key, value in items.items():
+            await self.set_item(key, value)
+
+    async def remove_many(self, keys: list):
+        """Remove several values from the storage.
+
+        :param keys: keys to remove the values
+        """
+        for key in keys:
+            await self.remove_item(key)
+
+    async def update(self, key: str, fn, default_value: str = None):
+        """Atomically replace the value with `fn(value)`, the key is removed if `fn` returns None.
+        Nothing is written if `fn` returns the stored value unchanged.
+        Default implementation is atomic only against other updates of this storage object,
+        backends shared between processes should override it.
+
+        :param key: key of the value
+        :param fn: function of the current value (or `default_value`) returning the new value
+        :param default_value: value passed to `fn` if key not found in storage
+        :return: new value
+        """
+        if self._update_lock is None:
+            self._update_lock = asyncio.Lock()
+
+        async with self._update_lock:
+            current = await self.get_item(key)
+            value = fn(default_value if current is None else current)
+            if value == current:
+                return value
+            if value is None:
+                await self.remove_item(key)
+            else:
+                await self.set_item(key, value)
+            return value
+
+    async def compare_and_set(self, key: str, expected_value: str, value: str) -> bool:
+        """Save the `value` only if the current value is `expected_value` (None means the key is absent).
+
+        :param key: key of the value
+        :param expected_value: value the key must have now
+        :param value: value to save, None removes the key
+        :return: True if the value was saved, nothing is written otherwise
+        """
+        swapped = False
+
+        def compare(current):
+            nonlocal swapped
+            if current != expected_value:
+                return current
+            swapped = True
+            return value
+
+        await self.update(key, compare)
+        return swapped
@@ -0,0 +1,199 @@
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from pytonconnect.logger import _LOGGER
+
+from ._interface import IStorage
+
+
+class LogFileStorage(IStorage):
+    """File storage which appends key updates to a log instead of rewriting the whole file.
+
+    Updates are applied to memory at once and written to the file in batches every `flush_interval`
+    seconds (fsync included) by a single background thread, so the event loop never waits for the disk.
+    When the log grows past `compact_threshold` bytes it is rewritten with the live keys only.
+    On start the log is replayed, a torn last record (crash during append) is dropped.
+    Updates done less than `flush_interval` seconds before a crash may be lost, call `flush()` to persist them.
+    """
+
+    DEFAULT_FLUSH_INTERVAL = 0.1
+    DEFAULT_COMPACT_THRESHOLD = 1024 * 1024
+
+    _file_path: Path
+    _cache: dict
+    _pending: list
+    _log_size: int
+    _compacted_size: int
+    _flush_interval: float
+    _compact_threshold: int
+    _executor: ThreadPoolExecutor
+    _flush_task: asyncio.Task
+    _lock: asyncio.Lock
+    _closed: bool
+
+    def __init__(self,
+                 file_path: str,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+                 compact_threshold: int = DEFAULT_COMPACT_THRESHOLD):
+        """
+        :param file_path: path of the log file
+        :param flush_interval: time in seconds to collect updates before writing them
+        :param compact_threshold: log size in bytes after which the log is compacted
+        """
+        self._file_path = Path(file_path)
+        self._flush_interval = flush_interval
+        self._compact_threshold = compact_threshold
+
+        self._cache = {}
+        self._pending = []
+        self._log_size = 0
+        self._replay()
+        self._compacted_size = self._log_size
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='pytonconnect-log-storage')
+        self._flush_task = None
+        self._lock = None
+        self._closed = False
+
+    async def set_item(self, key: str, value: str):
+        self._cache[key] = value
+        self._append_record([key, value])
+
+    async def get_item(self, key: str, default_value: str = None):
+        if key not in self._cache:
+            return default_value
+        return self._cache[key]
+
+    async def remove_item(self, key: str):
+        if key in self._cache:
+            del self._cache[key]
+            self._append_record([key])
+
+    async def get_many(self, keys: list, default_value: str = None) -> dict:
+        return {key: self._cache.get(key, default_value) for key in keys}
+
+    async def set_many(self, items: dict):
+        for key, value in items.items():
+            self._cache[key] = value
+            self._append_record([key, value])
+
+    async def remove_many(self, keys: list):
+        for key in keys:
+            if key in self._cache:
+                del self._cache[key]
+                self._append_record([key])
+
+    async def update(self, key: str, fn, default_value: str = None):
+        value = fn(self._cache.get(key, default_value))
+        if value == self._cache.get(key):
+            return value
+        if value is None:
+            await self.remove_item(key)
+        else:
+            await self.set_item(key, value)
+        return value
+
+    async def flush(self):
+        """Write collected updates to the file and compact the log if needed."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            records, self._pending = self._pending, []
+            if records:
+                data = ''.join(records).encode()
+                try:
+                    await loop.run_in_executor(self._executor, self._write_log, data)
+                except BaseException:
+                    # keep the records for the next flush, before the ones appended meanwhile
+                    self._pending[:0] = records
+                    raise
+                self._log_size += len(data)
+
+            if self._log_size > self._compact_threshold and self._log_size > 2 * self._compacted_size:
+                self._log_size = self._compacted_size = \
+                    await loop.run_in_executor(self._executor, self._write_snapshot, dict(self._cache))
+
+    async def close(self):
+        """Write collected updates and stop the writer thread."""
+        # a cancelled task would leave a write running in the thread with the log size not updated
+        self._closed = True
+        if self._flush_task is not None:
+            await self._flush_task
+        await self.flush()
+        self._executor.shutdown(wait=True)
+
+    def _append_record(self, record: list):
+        self._pending.append(json.dumps(record, separators=(',', ':')) + '\n')
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+
+    async def _flush_later(self):
+        # records appended while a flush runs don't schedule their own task, write them in the next round,
+        # records of a failed write are kept and retried the same way
+        while True:
+            await asyncio.sleep(self._flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                _LOGGER.exception(f'LogFileStorage flush {self._file_path}')
+            if not self._pending or self._closed:
+                return
+
+    def _replay(self):
+        try:
+            data = self._file_path.read_bytes()
+        except FileNotFoundError:
+            return
+
+        # everything after the last newline is a record torn by a crash during append
+        end = data.rfind(b'\n') + 1
+        if end < len(data):
+            _LOGGER.warning(f'LogFileStorage drops torn record at the end of {self._file_path}')
+            with open(self._file_path, 'r+b') as f:
+                f.truncate(end)
+
+        for line in data[:end].splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            if not isinstance(record, list) or len(record) not in (1, 2):
+                _LOGGER.warning(f'LogFileStorage skips broken record {line}')
+                continue
+            if len(record) == 2:
+                self._cache[record[0]] = record[1]
+            else:
+                self._cache.pop(record[0], None)
+        self._log_size = end
+
+    def _write_log(self, data: bytes):
+        fd = os.open(self._file_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            offset = os.lseek(fd, 0, os.SEEK_END)
+            try:
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(fd, view):]
+                os.fsync(fd)
+            except BaseException:
+                # drop a partly written batch, it is written again by the retry
+                os.ftruncate(fd, offset)
+                raise
+        finally:
+            os.close(fd)
+
+    def _write_snapshot(self, cache: dict) -> int:
+        data = ''.join(json.dumps([key, value], separators=(',', ':')) + '\n'
+                       for key, value in cache.items()).encode()
+        tmp_path = self._file_path.with_name(self._file_path.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._file_path)
+        return len(data)
@@ -0,0 +1,38 @@
+from ._interface import IStorage
+
+
+class NamespacedStorage(IStorage):
+    """View of a shared storage where every key is prefixed with the namespace."""
+
+    _storage: IStorage
+    _prefix: str
+
+    @property
+    def storage(self):
+        return self._storage
+
+    def __init__(self, storage: IStorage, namespace: str):
+        self._storage = storage
+        self._prefix = f'{namespace}:'
+
+    async def set_item(self, key: str, value: str):
+        await self._storage.set_item(self._prefix + key, value)
+
+    async def get_item(self, key: str, default_value: str = None):
+        return await self._storage.get_item(self._prefix + key, default_value)
+
+    async def remove_item(self, key: str):
+        await self._storage.remove_item(self._prefix + key)
+
+    async def get_many(self, keys: list, default_value: str = None) -> dict:
+        values = await self._storage.get_many([self._prefix + key for key in keys], default_value)
+        return {key: values[self._prefix + key] for key in keys}
+
+    async def set_many(self, items: dict):
+        await self._storage.set_many({self._prefix + key: value for key, value in items.items()})
+
+    async def remove_many(self, keys: list):
+        await self._storage.remove_many([self._prefix + key for key in keys])
+
+    async def update(self, key: str, fn, default_value: str = None):
+        return await self._storage.update(self._prefix + key, fn, default_value)
@@ -0,0 +1,270 @@
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+from pytonconnect._background import run_in_background
+from pytonconnect.logger import _LOGGER
+
+from ._interface import IStorage
+
+_REMOVED = object()
+
+
+class _SqliteDatabase:
+
+    # constant statements, compiled once and reused from the sqlite3 statement cache
+    SQL_CREATE = ('CREATE TABLE IF NOT EXISTS storage ('
+                  'namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, '
+                  'PRIMARY KEY (namespace, key)) WITHOUT ROWID')
+    SQL_SELECT = 'SELECT value FROM storage WHERE namespace = ? AND key = ?'
+    SQL_UPSERT = 'INSERT OR REPLACE INTO storage (namespace, key, value) VALUES (?, ?, ?)'
+    SQL_DELETE = 'DELETE FROM storage WHERE namespace = ? AND key = ?'
+    SQL_SELECT_MANY = 'SELECT key, value FROM storage WHERE namespace = ? AND key IN ({})'
+    SELECT_MANY_CHUNK = 500  # stays below SQLITE_MAX_VARIABLE_NUMBER of old sqlite builds
+
+    _db_path: str
+    _commit_interval: float
+    _max_batch: int
+    _executor: ThreadPoolExecutor
+    _connection: sqlite3.Connection
+    _pending: dict
+    _committing: dict
+    _commit_task: asyncio.Task
+    _lock: asyncio.Lock
+
+    def __init__(self, db_path: str, commit_interval: float, max_batch: int):
+        self._db_path = db_path
+        self._commit_interval = commit_interval
+        self._max_batch = max_batch
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='pytonconnect-sqlite-storage')
+        self._connection = None
+        self._pending = {}  # (namespace, key) -> value or _REMOVED, not committed yet
+        self._committing = {}
+        self._commit_task = None
+        self._lock = None
+
+    async def get(self, namespace: str, key: str):
+        for changes in (self._pending, self._committing):
+            if (namespace, key) in changes:
+                value = changes[(namespace, key)]
+                return None if value is _REMOVED else value
+        return await self._run(self._select, namespace, key)
+
+    async def get_many(self, namespace: str, keys: list) -> dict:
+        values, missing = {}, []
+        for key in keys:
+            for changes in (self._pending, self._committing):
+                if (namespace, key) in changes:
+                    value = changes[(namespace, key)]
+                    values[key] = None if value is _REMOVED else value
+                    break
+            else:
+                missing.append(key)
+
+        if missing:
+            values.update(await self._run(self._select_many, namespace, missing))
+        return values
+
+    def set(self, namespace: str, key: str, value):
+        self._pending[(namespace, key)] = value
+        if len(self._pending) >= self._max_batch:
+            run_in_background(self.commit(), f'SqliteStorage commit {self._db_path}')
+        elif self._commit_task is None or self._commit_task.done():
+            self._commit_task = asyncio.get_running_loop().create_task(self._commit_later())
+
+    async def commit(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            if not self._pending:
+                return
+            self._committing, self._pending = self._pending, {}
+            try:
+                await self._run(self._write, self._committing)
+            except Exception:
+                # keep the changes for the next commit, newer pending values win
+                self._committing.update(self._pending)
+                self._pending = self._committing
+                raise
+            finally:
+                self._committing = {}
+
+    async def update(self, namespace: str, key: str, fn, default_value):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        # pending writes go in the same transaction, so `fn` sees every earlier write
+        async with self._lock:
+            self._committing, self._pending = self._pending, {}
+            try:
+                return await self._run(self._write_and_update, self._committing, namespace, key, fn, default_value)
+            except Exception:
+                self._committing.update(self._pending)
+                self._pending = self._committing
+                raise
+            finally:
+                self._committing = {}
+
+    async def close(self):
+        if self._commit_task is not None and not self._commit_task.done():
+            self._commit_task.cancel()
+        await self.commit()
+        await self._run(self._close)
+        self._executor.shutdown(wait=True)
+
+    async def _commit_later(self):
+        # writes made while a commit runs don't schedule their own task, commit them in the next round
+        while True:
+            await asyncio.sleep(self._commit_interval)
+            await self._commit_logged()
+            if not self._pending:
+                return
+
+    async def _commit_logged(self):
+        try:
+            await self.commit()
+        except Exception:
+            _LOGGER.exception(f'SqliteStorage commit {self._db_path}')
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    # methods below are called in the database thread only
+
+    def _get_connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(self._db_path, isolation_level=None)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            self._connection.execute(self.SQL_CREATE)
+        return self._connection
+
+    def _select(self, namespace: str, key: str):
+        row = self._get_connection().execute(self.SQL_SELECT, (namespace, key)).fetchone()
+        return row[0] if row else None
+
+    def _select_many(self, namespace: str, keys: list) -> dict:
+        connection = self._get_connection()
+        values = {}
+        for i in range(0, len(keys), self.SELECT_MANY_CHUNK):
+            chunk = keys[i:i + self.SELECT_MANY_CHUNK]
+            sql = self.SQL_SELECT_MANY.format(', '.join('?' * len(chunk)))
+            values.update(connection.execute(sql, (namespace, *chunk)).fetchall())
+        return values
+
+    def _apply(self, connection: sqlite3.Connection, changes: dict):
+        upserts = [(ns, key, value) for (ns, key), value in changes.items() if value is not _REMOVED]
+        deletes = [(ns, key) for (ns, key), value in changes.items() if value is _REMOVED]
+        if upserts:
+            connection.executemany(self.SQL_UPSERT, upserts)
+        if deletes:
+            connection.executemany(self.SQL_DELETE, deletes)
+
+    def _write(self, changes: dict):
+        connection = self._get_connection()
+        connection.execute('BEGIN')
+        try:
+            self._apply(connection, changes)
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+    def _write_and_update(self, changes: dict, namespace: str, key: str, fn, default_value):
+        connection = self._get_connection()
+        # IMMEDIATE takes the write lock at once, other processes can't change the value in between
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            self._apply(connection, changes)
+            row = connection.execute(self.SQL_SELECT, (namespace, key)).fetchone()
+            stored = row[0] if row else None
+            value = fn(default_value if stored is None else stored)
+            if value != stored:
+                if value is None:
+                    connection.execute(self.SQL_DELETE, (namespace, key))
+                else:
+                    connection.execute(self.SQL_UPSERT, (namespace, key, value))
+            connection.execute('COMMIT')
+            return value
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+    def _close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+class SqliteStorage(IStorage):
+    """Storage on a SQLite database in WAL mode, made to keep sessions of many connectors.
+
+    Every key belongs to a namespace, use `with_namespace()` to get a storage of another session
+    sharing the same database. All queries run in one background thread, so the event loop is never blocked.
+    Writes are visible at once and committed in batches every `commit_interval` seconds
+    (or when `max_batch` keys are changed), call `flush()` to commit them immediately.
+    """
+
+    DEFAULT_COMMIT_INTERVAL = 0.05
+    DEFAULT_MAX_BATCH = 1000
+
+    _db: _SqliteDatabase
+    _namespace: str
+
+    @property
+    def namespace(self):
+        return self._namespace
+
+    def __init__(self,
+                 db_path: str,
+                 namespace: str = '',
+                 commit_interval: float = DEFAULT_COMMIT_INTERVAL,
+                 max_batch: int = DEFAULT_MAX_BATCH,
+                 _db: _SqliteDatabase = None):
+        """
+        :param db_path: path of the database file
+        :param namespace: namespace of the keys of this storage
+        :param commit_interval: time in seconds to collect writes before committing them
+        :param max_batch: number of changed keys that triggers a commit at once
+        """
+        self._db = _db or _SqliteDatabase(db_path, commit_interval, max_batch)
+        self._namespace = namespace
+
+    def with_namespace(self, namespace: str) -> 'SqliteStorage':
+        """Storage of another namespace in the same database."""
+        return SqliteStorage(self._db._db_path, namespace, _db=self._db)
+
+    async def set_item(self, key: str, value: str):
+        self._db.set(self._namespace, key, value)
+
+    async def get_item(self, key: str, default_value: str = None):
+        value = await self._db.get(self._namespace, key)
+        return default_value if value is None else value
+
+    async def remove_item(self, key: str):
+        self._db.set(self._namespace, key, _REMOVED)
+
+    async def get_many(self, keys: list, default_value: str = None) -> dict:
+        values = await self._db.get_many(self._namespace, keys)
+        return {key: default_value if values.get(key) is None else values[key] for key in keys}
+
+    async def set_many(self, items: dict):
+        for key, value in items.items():
+            self._db.set(self._namespace, key, value)
+
+    async def remove_many(self, keys: list):
+        for key in keys:
+            self._db.set(self._namespace, key, _REMOVED)
+
+    async def update(self, key: str, fn, default_value: str = None):
+        """Atomic also between processes sharing the database, `fn` is called in the database thread."""
+        return await self._db.update(self._namespace, key, fn, default_value)
+
+    async def flush(self):
+        """Commit all pending writes of the database."""
+        await self._db.commit()
+
+    async def close(self):
+        """Commit pending writes and close the database (for all namespaces)."""
+        await self._db.close()
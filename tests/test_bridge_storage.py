@@ -0,0 +1,130 @@
+import asyncio
+import json
+
+from pytonconnect.provider._bridge_storage import BridgeProviderStorage
+from pytonconnect.storage import DefaultStorage, IStorage, SqliteStorage
+
+CONNECTION = {'type': 'http', 'connect_event': {}, 'next_rpc_request_id': '0'}
+
+
+class CountingStorage(DefaultStorage):
+
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+        self.fail = False
+
+    async def set_item(self, key: str, value: str):
+        if self.fail:
+            raise OSError('storage is down')
+        self.writes += 1
+        await super().set_item(key, value)
+
+    async def update(self, key: str, fn, default_value: str = None):
+        if self.fail:
+            raise OSError('storage is down')
+        self.writes += 1
+        return await super().update(key, fn, default_value)
+
+
+async def _stored_connection(storage: IStorage) -> dict:
+    return json.loads(await storage.get_item(IStorage.KEY_CONNECTION, '{}'))
+
+
+def test_debounced_flush_writes_once():
+    async def run():
+        storage = CountingStorage()
+        provider_storage = BridgeProviderStorage(storage, BridgeProviderStorage.FLUSH_DEBOUNCED, flush_delay=0.05)
+        await provider_storage.setConnection(dict(CONNECTION))
+        storage.writes = 0
+
+        for event_id in range(1, 11):
+            await provider_storage.setLastWalletEventId(event_id)
+        assert provider_storage.dirty
+        assert storage.writes == 0
+
+        await asyncio.sleep(0.1)
+        assert not provider_storage.dirty
+        assert storage.writes == 1
+        assert (await _stored_connection(storage))['last_wallet_event_id'] == '10'
+
+    asyncio.run(run())
+
+
+def test_on_close_policy_writes_on_close():
+    async def run():
+        storage = CountingStorage()
+        provider_storage = BridgeProviderStorage(storage, BridgeProviderStorage.FLUSH_ON_CLOSE)
+        await provider_storage.setConnection(dict(CONNECTION))
+
+        await provider_storage.setLastWalletEventId(7)
+        assert 'last_wallet_event_id' not in await _stored_connection(storage)
+
+        await provider_storage.close()
+        assert (await _stored_connection(storage))['last_wallet_event_id'] == '7'
+
+    asyncio.run(run())
+
+
+def test_failed_flush_keeps_record_dirty():
+    async def run():
+        storage = CountingStorage()
+        provider_storage = BridgeProviderStorage(storage, BridgeProviderStorage.FLUSH_ON_CLOSE)
+        await provider_storage.setConnection(dict(CONNECTION))
+        await provider_storage.setLastWalletEventId(3)
+
+        storage.fail = True
+        try:
+            await provider_storage.flush()
+        except OSError:
+            pass
+        assert provider_storage.dirty
+
+        storage.fail = False
+        await provider_storage.flush()
+        assert not provider_storage.dirty
+        assert (await _stored_connection(storage))['last_wallet_event_id'] == '3'
+
+    asyncio.run(run())
+
+
+def test_rpc_request_ids_are_monotonic_after_restart(tmp_path):
+    async def run():
+        storage = SqliteStorage(str(tmp_path / 'storage.db'))
+        provider_storage = BridgeProviderStorage(storage, rpc_request_id_block_size=10)
+        await provider_storage.setConnection(dict(CONNECTION))
+        ids = [int(await provider_storage.increaseNextRpcRequestId()) for _ in range(3)]
+        await provider_storage.close()
+        await storage.close()
+
+        # ids left in the reserved range are skipped, never handed out again
+        storage = SqliteStorage(str(tmp_path / 'storage.db'))
+        provider_storage = BridgeProviderStorage(storage, rpc_request_id_block_size=10)
+        restarted_id = int(await provider_storage.increaseNextRpcRequestId())
+        await storage.close()
+
+        assert ids == [0, 1, 2]
+        assert restarted_id == 10
+
+    asyncio.run(run())
+
+
+def test_record_write_keeps_ranges_reserved_by_others(tmp_path):
+    async def run():
+        path = str(tmp_path / 'storage.db')
+        storage = SqliteStorage(path)
+        await storage.set_item(IStorage.KEY_CONNECTION, json.dumps(CONNECTION))
+        await storage.close()
+
+        storages = [SqliteStorage(path) for _ in range(3)]
+        first, second, third = [BridgeProviderStorage(storage, rpc_request_id_block_size=10) for storage in storages]
+        assert await first.increaseNextRpcRequestId() == '0'
+        assert await second.increaseNextRpcRequestId() == '10'
+        # the stale local counter of the first storage must not roll the stored one back
+        await first.setLastWalletEventId(5)
+        assert await third.increaseNextRpcRequestId() == '20'
+
+        for storage in storages:
+            await storage.close()
+
+    asyncio.run(run())
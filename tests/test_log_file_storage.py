@@ -0,0 +1,87 @@
+import asyncio
+
+from pytonconnect.storage import LogFileStorage
+
+
+def test_log_is_replayed(tmp_path):
+    async def run():
+        path = tmp_path / 'storage.log'
+        storage = LogFileStorage(str(path))
+        await storage.set_item('a', '1')
+        await storage.set_item('b', '2')
+        await storage.set_item('a', '3')
+        await storage.remove_item('b')
+        await storage.close()
+
+        storage = LogFileStorage(str(path))
+        assert await storage.get_many(['a', 'b']) == {'a': '3', 'b': None}
+        await storage.close()
+
+    asyncio.run(run())
+
+
+def test_torn_record_is_truncated(tmp_path):
+    async def run():
+        path = tmp_path / 'storage.log'
+        storage = LogFileStorage(str(path))
+        await storage.set_item('a', '1')
+        await storage.close()
+        size = path.stat().st_size
+
+        # crash in the middle of an append
+        with open(path, 'ab') as f:
+            f.write(b'["b","')
+
+        storage = LogFileStorage(str(path))
+        assert await storage.get_many(['a', 'b']) == {'a': '1', 'b': None}
+        assert path.stat().st_size == size
+
+        await storage.set_item('c', '2')
+        await storage.close()
+        storage = LogFileStorage(str(path))
+        assert await storage.get_item('c') == '2'
+        await storage.close()
+
+    asyncio.run(run())
+
+
+def test_failed_write_is_retried(tmp_path):
+    async def run():
+        path = tmp_path / 'storage.log'
+        storage = LogFileStorage(str(path), flush_interval=0.01)
+        write_log = storage._write_log
+        failures = [1]
+
+        def flaky_write_log(data: bytes):
+            if failures[0]:
+                failures[0] -= 1
+                raise OSError('disk is full')
+            write_log(data)
+
+        storage._write_log = flaky_write_log
+        await storage.set_item('a', '1')
+        await asyncio.sleep(0.1)
+        await storage.close()
+        assert not failures[0]
+
+        storage = LogFileStorage(str(path))
+        assert await storage.get_item('a') == '1'
+        await storage.close()
+
+    asyncio.run(run())
+
+
+def test_log_is_compacted(tmp_path):
+    async def run():
+        path = tmp_path / 'storage.log'
+        storage = LogFileStorage(str(path), compact_threshold=1024)
+        for i in range(200):
+            await storage.set_item('key', str(i))
+        await storage.close()
+
+        assert path.stat().st_size < 1024
+        storage = LogFileStorage(str(path))
+        assert await storage.get_item('key') == '199'
+        await storage.close()
+
+    asyncio.run(run())
@@ -0,0 +1,77 @@
+import asyncio
+import time
+
+from pytonconnect.provider import BridgeCircuitBreaker, ReconnectPolicy
+
+BRIDGE_URL = 'https://bridge.test/bridge'
+
+
+def test_delay_grows_exponentially_up_to_max():
+    policy = ReconnectPolicy(base_delay=1, max_delay=10, multiplier=2, jitter=0)
+    assert [policy.get_delay(attempt) for attempt in range(1, 7)] == [1, 2, 4, 8, 10, 10]
+
+
+def test_jitter_shortens_delay():
+    policy = ReconnectPolicy(base_delay=4, jitter=0.5)
+    delays = [policy.get_delay(1) for _ in range(100)]
+    assert all(2 <= delay <= 4 for delay in delays)
+    assert len(set(delays)) > 1
+
+
+def test_max_attempts_stops_reconnects():
+    policy = ReconnectPolicy(jitter=0, max_attempts=2)
+    assert policy.get_delay(2) is not None
+    assert policy.get_delay(3) is None
+
+
+def test_breaker_opens_after_threshold_and_closes_on_success():
+    policy = ReconnectPolicy(failure_threshold=3, reset_timeout=60)
+    breaker = policy.get_breaker(BRIDGE_URL + '/')
+    assert breaker is policy.get_breaker(BRIDGE_URL)
+
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == BridgeCircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == BridgeCircuitBreaker.OPEN
+    assert policy.degraded_bridges == {BRIDGE_URL: breaker}
+
+    breaker.record_success()
+    assert breaker.state == BridgeCircuitBreaker.CLOSED
+    assert policy.degraded_bridges == {}
+
+
+def test_breaker_lets_one_probe_through_when_half_open():
+    async def run():
+        breaker = BridgeCircuitBreaker(BRIDGE_URL, failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure()
+        assert breaker.state == BridgeCircuitBreaker.OPEN
+
+        await asyncio.sleep(0.06)
+        assert breaker.state == BridgeCircuitBreaker.HALF_OPEN
+        started = time.monotonic()
+        await breaker.wait()  # the probe goes at once
+        assert time.monotonic() - started < 0.05
+
+        # other streams wait for the probe, its success releases them
+        waiter = asyncio.ensure_future(breaker.wait())
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        breaker.record_success()
+        await asyncio.wait_for(waiter, 0.01)
+
+    asyncio.run(run())
+
+
+def test_failed_probe_opens_breaker_again():
+    async def run():
+        breaker = BridgeCircuitBreaker(BRIDGE_URL, failure_threshold=3, reset_timeout=0.05)
+        for _ in range(3):
+            breaker.record_failure()
+        await asyncio.sleep(0.06)
+        await breaker.wait()
+
+        breaker.record_failure()
+        assert breaker.state == BridgeCircuitBreaker.OPEN
+
+    asyncio.run(run())
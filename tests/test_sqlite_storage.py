@@ -0,0 +1,57 @@
+import asyncio
+import os
+import subprocess
+import sys
+import textwrap
+
+from pytonconnect.storage import SqliteStorage
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CRASHING_WRITER = textwrap.dedent('''
+    import asyncio, os, sys
+    from pytonconnect.storage import SqliteStorage
+
+    async def main():
+        storage = SqliteStorage(sys.argv[1], commit_interval=60)
+        await storage.set_item('committed', '1')
+        await storage.with_namespace('other').set_item('committed', '2')
+        await storage.flush()
+        await storage.set_item('pending', '3')
+        os._exit(0)  # crash: nothing is closed, the pending write is not committed
+
+    asyncio.run(main())
+''')
+
+
+def test_committed_writes_survive_crash(tmp_path):
+    path = str(tmp_path / 'storage.db')
+    subprocess.run([sys.executable, '-c', CRASHING_WRITER, path], cwd=PACKAGE_ROOT, check=True)
+
+    async def run():
+        storage = SqliteStorage(path)
+        assert await storage.get_many(['committed', 'pending']) == {'committed': '1', 'pending': None}
+        assert await storage.with_namespace('other').get_item('committed') == '2'
+
+        # the database is usable after the recovery
+        await storage.set_item('pending', '4')
+        await storage.close()
+        storage = SqliteStorage(path)
+        assert await storage.get_item('pending') == '4'
+        await storage.close()
+
+    asyncio.run(run())
+
+
+def test_namespaces_are_separated(tmp_path):
+    async def run():
+        storage = SqliteStorage(str(tmp_path / 'storage.db'))
+        other = storage.with_namespace('other')
+        await storage.set_item('key', '1')
+        await other.set_item('key', '2')
+        await other.remove_item('key')
+
+        assert await storage.get_item('key') == '1'
+        assert await other.get_item('key', 'default') == 'default'
+        await storage.close()
+
+    asyncio.run(run())
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+from pytonconnect.storage import DefaultStorage, FileStorage, IStorage, LogFileStorage, SqliteStorage
+
+
+class SlowStorage(IStorage):
+    """Storage with the default update, every read and write gives the other tasks a chance to run."""
+
+    def __init__(self):
+        self.values = {}
+        self.writes = 0
+
+    async def set_item(self, key: str, value: str):
+        await asyncio.sleep(0)
+        self.writes += 1
+        self.values[key] = value
+
+    async def get_item(self, key: str, default_value: str = None):
+        await asyncio.sleep(0)
+        return self.values.get(key, default_value)
+
+    async def remove_item(self, key: str):
+        await asyncio.sleep(0)
+        self.writes += 1
+        self.values.pop(key, None)
+
+
+STORAGES = {
+    'interface': lambda tmp_path: SlowStorage(),
+    'default': lambda tmp_path: DefaultStorage(),
+    'file': lambda tmp_path: FileStorage(str(tmp_path / 'storage.json')),
+    'log_file': lambda tmp_path: LogFileStorage(str(tmp_path / 'storage.log')),
+    'sqlite': lambda tmp_path: SqliteStorage(str(tmp_path / 'storage.db')),
+}
+
+
+async def _close(storage: IStorage):
+    if hasattr(storage, 'close'):
+        await storage.close()
+
+
+def _increment(value: str) -> str:
+    return str(int(value) + 1)
+
+
+@pytest.mark.parametrize('name', STORAGES)
+def test_concurrent_updates_are_not_lost(name, tmp_path):
+    async def run():
+        storage = STORAGES[name](tmp_path)
+        await asyncio.gather(*[storage.update('counter', _increment, '0') for _ in range(50)])
+        assert await storage.get_item('counter') == '50'
+        await _close(storage)
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize('name', STORAGES)
+def test_compare_and_set(name, tmp_path):
+    async def run():
+        storage = STORAGES[name](tmp_path)
+        assert await storage.compare_and_set('key', None, '1')
+        assert not await storage.compare_and_set('key', None, '2')
+        assert not await storage.compare_and_set('key', '2', '3')
+        assert await storage.get_item('key') == '1'
+        assert await storage.compare_and_set('key', '1', None)
+        assert await storage.get_item('key') is None
+        await _close(storage)
+
+    asyncio.run(run())
+
+
+def test_compare_and_set_mismatch_does_not_write():
+    async def run():
+        storage = SlowStorage()
+        assert not await storage.compare_and_set('key', 'expected', '1')
+        await storage.set_item('key', '1')
+        writes = storage.writes
+        assert not await storage.compare_and_set('key', 'expected', '2')
+        assert storage.writes == writes
+
+    asyncio.run(run())
+
+
+def test_sqlite_update_is_atomic_between_databases(tmp_path):
+    async def run():
+        path = str(tmp_path / 'storage.db')
+        storages = [SqliteStorage(path) for _ in range(4)]
+        await asyncio.gather(*[storage.update('counter', _increment, '0') for storage in storages for _ in range(10)])
+        for storage in storages:
+            await storage.close()
+
+        storage = SqliteStorage(path)
+        assert await storage.get_item('counter') == '40'
+        await storage.close()
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize('name', STORAGES)
+def test_many_operations(name, tmp_path):
+    async def run():
+        storage = STORAGES[name](tmp_path)
+        await storage.set_many({'a': '1', 'b': '2', 'c': '3'})
+        await storage.remove_many(['b', 'missing'])
+        assert await storage.get_many(['a', 'b', 'c'], 'none') == {'a': '1', 'b': 'none', 'c': '3'}
+        await _close(storage)
+
+    asyncio.run(run())